@@ -0,0 +1,143 @@
+import argparse, multiprocessing, os, queue, signal
+
+from time import sleep, time
+
+import enrichment_worker
+
+# Runs several enrichment workers in separate processes, so that one machine can use all of its cores.
+# Each worker claims its own tasks from the server. Workers that die are restarted.
+# On SIGTERM or Ctrl-C, the workers finish their current tasks before the supervisor exits.
+
+# Usage:
+# nohup python enrichment_supervisor.py --workers 8&
+
+# Max number of seconds to wait for the workers to finish their current tasks on shutdown
+SHUTDOWN_GRACE_SECONDS = 600
+
+# Workers that die sooner than this after starting are restarted with a delay, to avoid busy crash loops
+MIN_WORKER_UPTIME_SECONDS = 30
+RESTART_DELAY_SECONDS = 10
+
+# Number of seconds between throughput reports
+STATS_INTERVAL_SECONDS = 60
+
+
+def run_worker(args, stop_event, stats_queue):
+    # The supervisor decides when to stop. Ctrl-C reaches the whole process group, so the workers ignore it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    enrichment_worker.configure_worker(args)
+    enrichment_worker.main(args['tasks_per_claim'], stop_event, stats_queue)
+    enrichment_worker.say(enrichment_worker.cache_report())
+
+
+class Supervisor:
+    def __init__(self, args):
+        self.args = args
+        self.stop_event = multiprocessing.Event()
+        self.stats_queue = multiprocessing.Queue()
+        self.workers = [None] * args['workers']
+        self.started_at = [0] * args['workers']
+        self.restarts = 0
+        self.stats = ThroughputStats()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_shutdown)
+        signal.signal(signal.SIGINT, self.request_shutdown)
+        say('Starting {} workers'.format(len(self.workers)))
+        for index in range(len(self.workers)):
+            self.start_worker(index)
+        last_report = time()
+        while not self.stop_event.is_set():
+            self.collect_stats(timeout=1)
+            self.restart_dead_workers()
+            if time() - last_report >= self.args['stats_interval']:
+                say(self.stats.report(len(self.workers), self.restarts))
+                last_report = time()
+        self.shut_down()
+
+    def request_shutdown(self, signum, frame):
+        say('Shutting down after the current tasks...')
+        self.stop_event.set()
+
+    def start_worker(self, index):
+        worker = multiprocessing.Process(target=run_worker, args=(self.args, self.stop_event, self.stats_queue),
+                                         name='enrichment-worker-{}'.format(index))
+        worker.start()
+        self.workers[index] = worker
+        self.started_at[index] = time()
+
+    def restart_dead_workers(self):
+        for index, worker in enumerate(self.workers):
+            if worker.is_alive() or self.stop_event.is_set():
+                continue
+            say('Worker {} (pid {}) exited with code {}. Restarting.'.format(index, worker.pid, worker.exitcode))
+            if time() - self.started_at[index] < MIN_WORKER_UPTIME_SECONDS:
+                sleep(RESTART_DELAY_SECONDS)
+            self.restarts += 1
+            self.start_worker(index)
+
+    def collect_stats(self, timeout):
+        try:
+            self.stats.add(self.stats_queue.get(timeout=timeout))
+            while True:
+                self.stats.add(self.stats_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+    def shut_down(self):
+        deadline = time() + SHUTDOWN_GRACE_SECONDS
+        for worker in self.workers:
+            # keep reading stats, otherwise workers may block on a full queue
+            while worker.is_alive() and time() < deadline:
+                self.collect_stats(timeout=0.1)
+                worker.join(timeout=1)
+        for worker in self.workers:
+            if worker.is_alive():
+                say('Killing worker pid {}'.format(worker.pid))
+                worker.kill()
+                worker.join()
+        self.collect_stats(timeout=0)
+        say(self.stats.report(len(self.workers), self.restarts))
+        say('Bye')
+
+
+class ThroughputStats:
+    """
+    aggregates the stats that the workers report for each enriched material
+    """
+
+    def __init__(self):
+        self.start_time = time()
+        self.materials = 0
+        self.errors = 0
+        self.chunks = 0
+        self.enrichment_seconds = 0
+
+    def add(self, stats):
+        self.materials += 1
+        self.errors += stats['error']
+        self.chunks += stats['chunks']
+        self.enrichment_seconds += stats['seconds']
+
+    def report(self, n_workers, restarts):
+        minutes = (time() - self.start_time) / 60
+        per_minute = self.materials / minutes if minutes > 0 else 0
+        mean_seconds = self.enrichment_seconds / self.materials if self.materials > 0 else 0
+        return ('{} materials ({} errors, {} chunks) in {:.1f} minutes: {:.1f} materials per minute, '
+                '{:.1f} seconds per material, {} workers, {} restarts').format(
+            self.materials, self.errors, self.chunks, minutes, per_minute, mean_seconds, n_workers, restarts)
+
+
+def say(text):
+    print('X5Learn Enrichment Supervisor says:', text, flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs several X5Learn enrichment workers in parallel')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int,
+                        help='number of worker processes')
+    parser.add_argument('--stats-interval', default=STATS_INTERVAL_SECONDS, type=int,
+                        help='number of seconds between throughput reports')
+    enrichment_worker.add_worker_arguments(parser)
+    Supervisor(vars(parser.parse_args())).run()
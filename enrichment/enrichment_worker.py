@@ -1,16 +1,19 @@
-import os, requests, re, json, itertools
+import os, requests, re, json, random, atexit
 
-from time import sleep
+from time import sleep, time
 from collections import defaultdict
 
-from langdetect import detect_langs
-
 from wikichunkifiers.pdf import extract_chunks_from_pdf
 from wikichunkifiers.generic import extract_chunks_from_generic_text
 from wikichunkifiers.video import extract_chunks_from_x5gon_video
-from wikichunkifiers.lib.util import EnrichmentError
-
-import wikipedia
+from wikichunkifiers.lib.util import EnrichmentError, CACHE_DIR
+from wikichunkifiers.lib.text_search import MultiPatternMatcher
+from wikichunkifiers.lib.sentences import SentenceIndex
+from wikichunkifiers.lib.disjoint_set import DisjointSet
+from wikichunkifiers.lib.language import EnglishFilter, set_deterministic
+from wikichunkifiers.lib.wikipedia_links import get_links, configure_link_provider, link_cache_report, \
+    LINK_CACHE_TTL_SECONDS
+from wikichunkifiers.lib.wikify import set_parallelism, configure_annotation_cache, annotation_cache_report
 
 API_ROOT = "http://x5learn.org/api/v1/"
 
@@ -18,39 +21,99 @@ API_ROOT = "http://x5learn.org/api/v1/"
 # API_ROOT = 'http://127.0.0.1:5000/api/v1/'
 
 
-def main():
-    """ Runs every 5 seconds to get the pending enrichment tasks and runs them to enrich them.
+# Number of seconds the server may keep a request for tasks open until a task becomes available
+LONG_POLL_SECONDS = 25
+
+# Waiting times after failures grow exponentially from BACKOFF_BASE_SECONDS up to BACKOFF_MAX_SECONDS
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 120
+
+# Number of the most frequent concepts in a material that are grouped into clusters
+MAX_CONCEPT_TITLES = 5
+
+
+def main(tasks_per_claim=1, stop_event=None, stats_queue=None):
+    """ Waits for pending enrichment tasks and runs them to enrich them.
+
+    Args:
+        tasks_per_claim (int): number of tasks to claim from the server at once
+        stop_event (multiprocessing.Event): when set, the worker stops after finishing its current tasks
+        stats_queue (multiprocessing.Queue): receives the stats of every enrichment, see enrich
     """
     say('hello')
-    while (True):
+    failures = 0
+    while stop_event is None or not stop_event.is_set():
         try:
-            # get oer record of the most recent requested materials
-            r = requests.post(API_ROOT + "most_urgent_unstarted_enrichment_task/", data={})
-            # get json obj with (url, material data)
+            # get oer records of the most recent requested materials.
+            # The server holds the request until a task is available or LONG_POLL_SECONDS have passed.
+            r = requests.post(API_ROOT + "most_urgent_unstarted_enrichment_task/",
+                              data={'limit': tasks_per_claim, 'wait': LONG_POLL_SECONDS},
+                              timeout=LONG_POLL_SECONDS + 30)
+            # get json obj with a list of (url, material data)
             j = json.loads(r.text)
             # if there is additional data in j
-            if 'data' in j:
-                oer_data = j['data']
-                url = oer_data['url']
-                enrichment_data, error = make_enrichment_data(oer_data)
-                post_back_wikichunks(url, enrichment_data, error if error is None else error[:255])
-                if error is None:
-                    print('NO ERRORS')
-                else:
-                    print('ERROR:', error)
+            if 'tasks' in j:
+                failures = 0
+                for task in j['tasks']:
+                    if 'claimedAt' in task and not confirm_claim(task['data']['url'], task['claimedAt']):
+                        say('Skipping a task that another worker has claimed in the meantime')
+                        continue
+                    stats = enrich(task['data'])
+                    if stats_queue is not None:
+                        stats_queue.put(stats)
             elif 'info' in j:
+                failures = 0
                 say(j['info'])
-                sleep(2)
             else:
                 say('Response is missing essential fields')
-                sleep(60)
+                failures += 1
+                back_off(failures, stop_event)
         except requests.exceptions.ConnectionError:
             say('ConnectionError caught - waiting for main app to respond.')
-            sleep(5)
+            failures += 1
+            back_off(failures, stop_event)
         except Exception as err:
             print("\nError : {0}".format(err))
             say('Something went wrong. Waiting.')
-            sleep(5)
+            failures += 1
+            back_off(failures, stop_event)
+
+
+def confirm_claim(url, claimed_at):
+    # Renews the claim right before starting the task, since the previous tasks of the batch may have taken a while
+    r = requests.post(API_ROOT + "start_enrichment_task/", data={'url': url, 'claimedAt': claimed_at})
+    return json.loads(r.text)['start']
+
+
+def back_off(failures, stop_event=None):
+    # exponential backoff with full jitter, so that workers don't retry in lockstep
+    seconds = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** failures))
+    say('Retrying in {:.1f} seconds'.format(seconds))
+    if stop_event is None:
+        sleep(seconds)
+    else:
+        stop_event.wait(seconds)  # returns early on shutdown
+
+
+def enrich(oer_data):
+    """Enriches one material and posts the result back to the server.
+
+    Returns:
+        {key: val}: stats for the supervisor, i.e. url, seconds, number of chunks and whether an error occurred
+    """
+    url = oer_data['url']
+    start_time = time()
+    enrichment_data, error = make_enrichment_data(oer_data)
+    post_back_wikichunks(url, enrichment_data, error if error is None else error[:255])
+    if error is None:
+        print('NO ERRORS')
+    else:
+        print('ERROR:', error)
+    seconds = time() - start_time
+    print('Wall time: {:.1f} seconds for {} chunks, {}'.format(seconds, len(enrichment_data['chunks']), url))
+    print(annotation_cache_report())
+    print(link_cache_report())
+    return {'url': url, 'seconds': seconds, 'chunks': len(enrichment_data['chunks']), 'error': error is not None}
 
 
 def say(text):
@@ -120,17 +183,14 @@ def extract_concept_clusters(chunks, mentions):
             if len(title) > 2 and entity[
                 'id'] in mentions:  # Exclude titles that are too short, such as one-letter variable names
                 occurrences[title] += 1
-    titles = [x[0] for x in sorted(occurrences.items(), key=lambda k_v: k_v[1], reverse=True)[:5]]
+    titles = [x[0] for x in sorted(occurrences.items(), key=lambda k_v: k_v[1], reverse=True)[:MAX_CONCEPT_TITLES]]
     print('Titles:', titles)
     clusters = []
-
+    # One batched (and usually cached) lookup for all titles
+    links_per_title = get_links(titles)
+    title_set = set(titles)
     for title in titles:
-        try:
-            links = wikipedia.page(title).links
-        except Exception as err:
-            links = []
-            print('Ignoring error: ', err)
-        links = [link for link in links if link in titles]
+        links = [link for link in links_per_title.get(title, []) if link in title_set]
         cluster = [title] + links
         clusters.append(cluster)
 
@@ -151,28 +211,31 @@ def extract_mentions(chunks):
                      entities}.values())  #  remove duplicates. solution adapted from https://stackoverflow.com/a/11092590/2237986
     entities = [e for e in entities if
                 len(e['title']) > 1]  # exclude super-short titles, such as one-letter names of mathematical variables
-    for entity in entities:
+    titles = [search_title(entity) for entity in entities]
+    # Find the positions of all titles in a single pass over each chunk
+    matcher = MultiPatternMatcher(titles)
+    texts = [re.sub(r'\s+', ' ', chunk['text']) for chunk in chunks]
+    positions_per_chunk = [matcher.positions(text.lower()) for text in texts]
+    # Look up sentences by binary search instead of rescanning the chunk for every mention
+    sentence_indexes = [SentenceIndex(text) for text in texts]
+    # Classify the language of each chunk once and only check single sentences in mixed-language chunks
+    english_filters = [EnglishFilter(text) for text in texts]
+    for entity, title in zip(entities, titles):
         entity_id = entity['id']
-        title = entity['title'].lower()
-        title = remove_stuff_in_parentheses(
-            title)  # e.g. look for mentions of "strategy" if the concept is "strategy (game theory)"
-        title = title.strip()
-        for chunk in chunks:
-            text = chunk['text']
-            text = re.sub(r'\s+', ' ', text)
-            positions = [m.start() for m in re.finditer(re.escape(title), text.lower())]
+        for chunk, text, positions_per_title, sentences, english in zip(chunks, texts, positions_per_chunk,
+                                                                        sentence_indexes, english_filters):
             prev_position = None
-            for position in positions:
+            for position in positions_per_title.get(title, []):
                 position += int(
                     len(title) / 2)  # Focus on the middle of the title to account for variations in surrounding blanks
-                if prev_position is not None and position - prev_position < 200 and not contains_end_mark(
-                        text[prev_position:position]):  # ignore adjacent mentions as described in issue #167
+                if prev_position is not None and position - prev_position < 200 and not sentences.contains_end_mark(
+                        prev_position, position):  # ignore adjacent mentions as described in issue #167
                     continue
                 prev_position = position
-                sentence, pos_in_chunk = sentence_at_position(text, position)
+                sentence, pos_in_chunk = sentences.sentence_at(position)
                 if len(sentence) > 200:  # probably not a normal sentence
-                    sentence, pos_in_chunk = excerpt_at_position(text, position)
-                if not looks_like_english(sentence):
+                    sentence, pos_in_chunk = sentences.excerpt_at(position)
+                if not english.accepts(sentence):
                     continue
                 position_in_resource = round(chunk['start'] + chunk['length'] * pos_in_chunk / len(text), 4)
                 if entity_id not in mentions:  # could we use defaultdict for this? not sure if it works for lists. too lazy/rushed to check now.
@@ -184,28 +247,11 @@ def extract_mentions(chunks):
     return mentions
 
 
-def contains_end_mark(text):
-    return re.search(r'[.?!]', text)
-
-
-def sentence_at_position(text, position):
-    end_mark_positions = [m.start() for m in re.finditer('[.!?]([ ]|$)', text)]
-    if len(end_mark_positions) == 0:
-        return text, 0
-    sentence_start_position = 0
-    for end_mark_position in end_mark_positions:
-        if end_mark_position > position:
-            return text[sentence_start_position:(end_mark_position + 1)], sentence_start_position
-        sentence_start_position = end_mark_position + 1
-    return text[sentence_start_position:], sentence_start_position
-
-
-def excerpt_at_position(text, position):
-    start_pos = max(0, position - 70)
-    end_pos = position + 80
-    words = text[start_pos:end_pos].split(' ')
-    excerpt = ' '.join(words[1:-1])
-    return '…' + excerpt + '…', start_pos
+def search_title(entity):
+    title = entity['title'].lower()
+    title = remove_stuff_in_parentheses(
+        title)  # e.g. look for mentions of "strategy" if the concept is "strategy (game theory)"
+    return title.strip()
 
 
 def post_back_wikichunks(url, data, error):
@@ -214,36 +260,75 @@ def post_back_wikichunks(url, data, error):
     # print('post_back_wikichunks', payload)
 
 
-def looks_like_english(sentence):
-    language = detect_langs(sentence)[0]
-    return language.lang == 'en' and language.prob > 0.9
-
-
 def remove_stuff_in_parentheses(text):
     return re.sub(r'\([^)]*\)', '', text)
 
 
 def merge_clusters(raw_clusters):
-    resulting_merged_clusters = []
-    # print('raw_clusters', raw_clusters)
-    for raw_cluster in raw_clusters:
-        # print('raw_cluster', raw_cluster)
-        overlapping_merged_clusters = [c for c in resulting_merged_clusters if not set(c).isdisjoint(set(raw_cluster))]
-        # print('overlapping_merged_clusters', overlapping_merged_clusters)
-        for o in overlapping_merged_clusters:
-            resulting_merged_clusters.remove(o)
-        merged_cluster = raw_cluster + list(itertools.chain(*overlapping_merged_clusters))
-        # print("merged_cluster", merged_cluster)
-        resulting_merged_clusters.append(unique_list_of_lists(merged_cluster))
-        # print("without dupls:", merged_cluster)
-    # print(resulting_merged_clusters)
-    return resulting_merged_clusters
+    """Merges clusters that share titles, until all clusters are disjoint.
 
-
-def unique_list_of_lists(k):  # https://stackoverflow.com/a/2213973/2237986
-    k.sort()
-    return list(k for k, _ in itertools.groupby(k))
+    Each resulting cluster is sorted. The clusters are ordered by the last raw cluster that they contain.
+    """
+    titles = DisjointSet()
+    for raw_cluster in raw_clusters:
+        for title in raw_cluster:
+            titles.union(raw_cluster[0], title)
+    members = defaultdict(set)
+    last_raw_cluster_index = {}
+    for index, raw_cluster in enumerate(raw_clusters):
+        if len(raw_cluster) > 0:
+            root = titles.find(raw_cluster[0])
+            members[root].update(raw_cluster)
+            last_raw_cluster_index[root] = index
+    roots = sorted(last_raw_cluster_index, key=last_raw_cluster_index.get)
+    return [sorted(members[root]) for root in roots]
+
+
+def add_worker_arguments(parser):
+    parser.add_argument('--tasks-per-claim', default=1, type=int,
+                        help='number of tasks to claim from the server at once')
+    parser.add_argument('--wikifier-parallelism', default=4, type=int,
+                        help='number of chunks to send to the wikifier at the same time')
+    parser.add_argument('--annotation-cache-path', type=str,
+                        default=os.path.join(CACHE_DIR, 'wikifier_annotations.sqlite'),
+                        help='sqlite file for caching wikifier annotations')
+    parser.add_argument('--annotation-cache-size', default=200000, type=int,
+                        help='max number of cached wikifier annotations. 0 disables the cache.')
+    parser.add_argument('--link-cache-path', type=str,
+                        default=os.path.join(CACHE_DIR, 'wikipedia_links.sqlite'),
+                        help='sqlite file for caching the links between Wikipedia pages')
+    parser.add_argument('--link-cache-ttl', default=LINK_CACHE_TTL_SECONDS, type=int,
+                        help='max age of cached Wikipedia links in seconds. 0 disables the cache.')
+    parser.add_argument('--link-adjacency-file', type=str,
+                        help='read Wikipedia links from this tab-separated file (derived from a dump) instead of the API')
+    parser.add_argument('--max-concept-titles', default=MAX_CONCEPT_TITLES, type=int,
+                        help='number of the most frequent concepts per material to group into clusters')
+    parser.add_argument('--deterministic', action='store_true',
+                        help='seed the language detection so that repeated enrichments produce identical output')
+
+
+def configure_worker(args):
+    """Applies the options from add_worker_arguments. Call this in each worker process before main."""
+    global MAX_CONCEPT_TITLES
+    MAX_CONCEPT_TITLES = args['max_concept_titles']
+    if args['deterministic']:
+        set_deterministic()
+    set_parallelism(args['wikifier_parallelism'])
+    configure_annotation_cache(args['annotation_cache_path'], args['annotation_cache_size'])
+    configure_link_provider(args['link_adjacency_file'], args['link_cache_path'], args['link_cache_ttl'])
+
+
+def cache_report():
+    return annotation_cache_report() + '. ' + link_cache_report()
 
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='X5Learn enrichment worker')
+    add_worker_arguments(parser)
+    args = vars(parser.parse_args())
+    configure_worker(args)
+    # report how much the caches have saved at the end of the session
+    atexit.register(lambda: say(cache_report()))
+    main(args['tasks_per_claim'])
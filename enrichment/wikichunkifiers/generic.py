@@ -1,7 +1,7 @@
 import requests, math, json, os, sys, re
 
-from wikichunkifiers.lib.util import temp_file_path, EnrichmentError, make_chunk
-from wikichunkifiers.lib.wikify import get_entities, WIKIFIER_CHARACTER_LIMIT
+from wikichunkifiers.lib.util import EnrichmentError, make_chunk
+from wikichunkifiers.lib.wikify import get_entities_for_parts, WIKIFIER_CHARACTER_LIMIT
 
 
 def extract_chunks_from_generic_text(url, data):
@@ -12,11 +12,12 @@ def extract_chunks_from_generic_text(url, data):
 
     parts = split_text_into_equal_parts(text)
 
+    print('Processing', len(parts), 'chunks')
+    entities_per_part = get_entities_for_parts(parts)
+
     chunks = []
     start = 0
-    for index, part in enumerate(parts):
-        print('Processing chunk', index+1, '/', len(parts))
-        entities = get_entities(part)
+    for part, entities in zip(parts, entities_per_part):
         length = len(part) / len(text)
         chunk = make_chunk(start, length, entities, part)
         # print(json.dumps(chunk, indent=4, sort_keys=True))
@@ -0,0 +1,31 @@
+class DisjointSet:
+    """Union-find over hashable items, with path compression and union by size.
+    """
+
+    def __init__(self):
+        self.parents = {}
+        self.sizes = {}
+
+    def add(self, item):
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+
+    def find(self, item):
+        self.add(item)
+        root = item
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[item] != root:
+            self.parents[item], item = root, self.parents[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.sizes[root_a] < self.sizes[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parents[root_b] = root_a
+        self.sizes[root_a] += self.sizes[root_b]
+        return root_a
@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+from langdetect import detect_langs, DetectorFactory
+from langdetect.lang_detect_exception import LangDetectException
+
+# Min probability for a sentence to count as English
+ENGLISH_PROBABILITY = 0.9
+
+# If langdetect is at least this sure about the language of a whole chunk,
+# the sentences in that chunk aren't checked individually
+MONOLINGUAL_PROBABILITY = 0.99
+
+# Max number of sentences whose detected language is remembered
+LANGUAGE_CACHE_SIZE = 20000
+
+MIXED = 'mixed'
+
+
+def set_deterministic(seed=0):
+    """Makes langdetect return the same results for the same texts, so that repeated enrichments are identical."""
+    DetectorFactory.seed = seed
+    detect_sentence_language.cache_clear()
+
+
+def detect_language(text):
+    """Returns the most likely language of the text and its probability."""
+    try:
+        language = detect_langs(text)[0]
+    except LangDetectException:  # e.g. no letters in the text
+        return None, 0
+    return language.lang, language.prob
+
+
+@lru_cache(maxsize=LANGUAGE_CACHE_SIZE)
+def detect_sentence_language(sentence):
+    # Identical sentences, e.g. repeated mentions in the same sentence, are only detected once
+    return detect_language(sentence)
+
+
+def looks_like_english(sentence):
+    lang, prob = detect_sentence_language(sentence)
+    return lang == 'en' and prob > ENGLISH_PROBABILITY
+
+
+class EnglishFilter:
+    """Tells which sentences of a chunk are in English.
+
+    The chunk as a whole is classified once, when the first sentence is checked.
+    Sentences are only checked individually if the chunk is mixed-language.
+    """
+
+    def __init__(self, chunk_text):
+        self.chunk_text = chunk_text
+        self._chunk_language = None
+
+    def accepts(self, sentence):
+        chunk_language = self.chunk_language()
+        if chunk_language == MIXED:
+            return looks_like_english(sentence)
+        return chunk_language == 'en'
+
+    def chunk_language(self):
+        if self._chunk_language is None:
+            lang, prob = detect_language(self.chunk_text)
+            self._chunk_language = lang if prob >= MONOLINGUAL_PROBABILITY else MIXED
+        return self._chunk_language
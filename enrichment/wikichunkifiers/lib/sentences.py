@@ -0,0 +1,41 @@
+import re
+from bisect import bisect_left, bisect_right
+
+
+class SentenceIndex:
+    """Answers position-to-sentence lookups on a text by binary search.
+
+    The end marks are found once when the index is built, so that looking up many
+    positions in the same text doesn't rescan it each time.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        # any end mark, e.g. for telling whether two mentions are in the same sentence
+        self.end_mark_positions = [m.start() for m in re.finditer(r'[.?!]', text)]
+        # end marks that are followed by a blank or the end of the text
+        self.sentence_end_positions = [m.start() for m in re.finditer('[.!?]([ ]|$)', text)]
+
+    def sentence_at(self, position):
+        """Returns the sentence that contains the position, and the start position of that sentence."""
+        ends = self.sentence_end_positions
+        if len(ends) == 0:
+            return self.text, 0
+        index = bisect_right(ends, position)
+        start = ends[index - 1] + 1 if index > 0 else 0
+        if index == len(ends):
+            return self.text[start:], start
+        return self.text[start:(ends[index] + 1)], start
+
+    def excerpt_at(self, position):
+        """Returns the words around the position, for texts that don't consist of normal sentences."""
+        start_pos = max(0, position - 70)
+        end_pos = position + 80
+        words = self.text[start_pos:end_pos].split(' ')
+        excerpt = ' '.join(words[1:-1])
+        return '…' + excerpt + '…', start_pos
+
+    def contains_end_mark(self, start, end):
+        """Tells whether text[start:end] contains an end mark."""
+        index = bisect_left(self.end_mark_positions, start)
+        return index < len(self.end_mark_positions) and self.end_mark_positions[index] < end
@@ -0,0 +1,103 @@
+import os, json, sqlite3, threading, time
+
+# Evicting is a relatively expensive query, so we only check the size of the cache every so often
+EVICTION_INTERVAL = 100
+
+# Hits only update the time of last use, which doesn't need to be written right away.
+# Collecting these updates keeps reads from competing with other processes for the write lock.
+USED_AT_UPDATE_INTERVAL = 100
+
+# Number of seconds to wait for other processes that are writing to the same cache file
+LOCK_TIMEOUT_SECONDS = 10
+
+
+class SqliteCache:
+    """Persistent key-value store for JSON-serializable values, bounded by the number of entries.
+
+    When the cache grows beyond max_entries, the least recently used entries are evicted.
+    Entries that are older than ttl_seconds (if given) count as missing.
+    The cache can be shared between threads and processes. Errors are counted and reported as misses.
+    """
+
+    def __init__(self, path, max_entries, ttl_seconds=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._sets_since_eviction = 0
+        self._used_at = {}
+
+    def get(self, key):
+        # The cache is only an optimisation, so failures (e.g. a locked database) count as misses
+        with self._lock:
+            try:
+                row = self._connect().execute('SELECT value, stored_at FROM cache WHERE key = ?', (key,)).fetchone()
+                now = time.time()
+                if row is None or (self.ttl_seconds is not None and now - row[1] > self.ttl_seconds):
+                    self.misses += 1
+                    return None
+                self._used_at[key] = now
+                if len(self._used_at) >= USED_AT_UPDATE_INTERVAL:
+                    self._write_used_at()
+                    self._connection.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            except sqlite3.Error as err:
+                self._handle_error(err)
+                self.misses += 1
+                return None
+
+    def set(self, key, value):
+        with self._lock:
+            try:
+                connection = self._connect()
+                now = time.time()
+                connection.execute('INSERT OR REPLACE INTO cache (key, value, stored_at, used_at) '
+                                   'VALUES (?, ?, ?, ?)', (key, json.dumps(value), now, now))
+                self._used_at.pop(key, None)
+                self._write_used_at()
+                self._sets_since_eviction += 1
+                if self._sets_since_eviction >= EVICTION_INTERVAL:
+                    self._sets_since_eviction = 0
+                    connection.execute('DELETE FROM cache WHERE key IN '
+                                       '(SELECT key FROM cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                                       (self.max_entries,))
+                connection.commit()
+            except sqlite3.Error as err:
+                self._handle_error(err)
+
+    def hit_rate_report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups > 0 else 0
+        return '{} hits, {} misses ({:.1f}% hit rate), {} errors'.format(self.hits, self.misses, rate, self.errors)
+
+    def _write_used_at(self):
+        if self._used_at:
+            self._connection.executemany('UPDATE cache SET used_at = ? WHERE key = ?',
+                                         [(used_at, key) for key, used_at in self._used_at.items()])
+            self._used_at = {}
+
+    def _handle_error(self, err):
+        self.errors += 1
+        print('Cache error in {}: {}'.format(self.path, err))
+        if self._connection is not None:
+            try:
+                self._connection.rollback()
+            except sqlite3.Error:
+                self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT_SECONDS, check_same_thread=False)
+            # WAL lets processes read while another one is writing
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value TEXT, stored_at REAL, used_at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)')
+            self._connection = connection
+        return self._connection
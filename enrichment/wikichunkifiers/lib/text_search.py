@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class MultiPatternMatcher:
+    """Finds all occurrences of many patterns in a single pass over a text (Aho-Corasick automaton).
+    """
+
+    def __init__(self, patterns):
+        # ignore duplicates and empty patterns
+        self.patterns = [pattern for pattern in dict.fromkeys(patterns) if pattern]
+        self._transitions = [{}]
+        self._fallbacks = [0]
+        self._matches = [[]]
+        for index, pattern in enumerate(self.patterns):
+            self._add_pattern(pattern, index)
+        self._link_fallbacks()
+
+    def find_all(self, text):
+        """Yields (start, pattern_index) for every occurrence, including overlapping ones, ordered by end position.
+        """
+        state = 0
+        for position, character in enumerate(text):
+            while state and character not in self._transitions[state]:
+                state = self._fallbacks[state]
+            state = self._transitions[state].get(character, 0)
+            for index in self._matches[state]:
+                yield position - len(self.patterns[index]) + 1, index
+
+    def positions(self, text):
+        """Returns the start positions of each pattern, skipping overlapping occurrences of the same pattern.
+
+        This gives the same results as running re.finditer(re.escape(pattern), text) for each pattern.
+
+        Returns:
+            {str: [int]}: sorted start positions for each pattern that occurs in the text
+        """
+        result = {}
+        ends = {}
+        for start, index in self.find_all(text):
+            if start >= ends.get(index, 0):
+                ends[index] = start + len(self.patterns[index])
+                result.setdefault(self.patterns[index], []).append(start)
+        return result
+
+    def _add_pattern(self, pattern, index):
+        state = 0
+        for character in pattern:
+            if character not in self._transitions[state]:
+                self._transitions.append({})
+                self._fallbacks.append(0)
+                self._matches.append([])
+                self._transitions[state][character] = len(self._transitions) - 1
+            state = self._transitions[state][character]
+        self._matches[state].append(index)
+
+    def _link_fallbacks(self):
+        # breadth-first, so that the fallbacks of shorter prefixes are known first
+        queue = deque(self._transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._transitions[state].items():
+                fallback = self._fallbacks[state]
+                while fallback and character not in self._transitions[fallback]:
+                    fallback = self._fallbacks[fallback]
+                self._fallbacks[next_state] = self._transitions[fallback].get(character, 0)
+                self._matches[next_state] += self._matches[self._fallbacks[next_state]]
+                queue.append(next_state)
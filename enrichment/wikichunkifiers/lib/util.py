@@ -1,11 +1,28 @@
-import os
+import os, tempfile
+from contextlib import contextmanager
 
 
 TEMP_DIR = '/tmp/'
 
-
-def temp_file_path(suffix):
-    return TEMP_DIR+'x5learn_temp_'+str(os.getpid())+'.'+suffix
+# Persistent caches that survive restarts of the enrichment worker
+CACHE_DIR = os.path.expanduser('~/.cache/x5learn/')
+
+
+@contextmanager
+def temp_file(suffix):
+    """Creates a temporary file with a unique path, and deletes it when the job is done.
+
+    Usage:
+        with temp_file('pdf') as path:
+            ...
+    """
+    handle, path = tempfile.mkstemp(suffix='.'+suffix, prefix='x5learn_temp_', dir=TEMP_DIR)
+    os.close(handle)
+    try:
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
 
 
@@ -1,25 +1,87 @@
-import requests, json
+import requests, json, hashlib, os
+from concurrent.futures import ThreadPoolExecutor
 
-from wikichunkifiers.lib.util import EnrichmentError
+from wikichunkifiers.lib.util import EnrichmentError, CACHE_DIR
+from wikichunkifiers.lib.sqlite_cache import SqliteCache
 
 WIKIFIER_CHARACTER_LIMIT = 24999
 WIKIFIER_BLACKLIST = ['Forward (association football)' , 'RenderX', 'MEDLINE', 'Medline', 'MedLine', 'medline', 'MEDLAR', '[Music]']
 
+# Max number of chunks that are sent to the wikifier at the same time. Can be changed with set_parallelism.
+WIKIFIER_PARALLELISM = 4
+
+# Keep connections to the wikifier alive between requests
+session = requests.Session()
+
+WIKIFIER_PARAMETERS = {'lang': 'auto',
+                       'support': 'false',
+                       'ranges': 'false',
+                       'includeCosines': 'true',
+                       'nTopDfValuesToIgnore': 50,
+                       'nWordsToIgnoreFromList': 50,
+                       }
+
+# Annotations of identical chunks are reused, e.g. when materials are re-enriched.
+# Bump this version when changing the way entities are derived from the annotations.
+ANNOTATION_CACHE_VERSION = 1
+annotation_cache = SqliteCache(os.path.join(CACHE_DIR, 'wikifier_annotations.sqlite'), max_entries=200000)
+
+
+def configure_annotation_cache(path, max_entries):
+    """Replaces the default annotation cache. max_entries=0 disables caching."""
+    global annotation_cache
+    annotation_cache = SqliteCache(path, max_entries) if max_entries > 0 else None
+
+
+def set_parallelism(parallelism):
+    global WIKIFIER_PARALLELISM
+    WIKIFIER_PARALLELISM = parallelism
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=parallelism))
+
+
+def get_entities_for_parts(parts):
+    """Annotates several parts of a text concurrently.
+
+    Args:
+        parts ([str]): parts of a text
+
+    Returns:
+        ([[dict]]): the entities of each part, in the same order as the parts
+    """
+    with ThreadPoolExecutor(max_workers=WIKIFIER_PARALLELISM) as executor:
+        return list(executor.map(get_entities, parts))
+
+
 def get_entities(text):
     text = filter_blacklisted_terms(text)
     if len(text)>WIKIFIER_CHARACTER_LIMIT:
         print('Warning: Character limit exceeded. Text truncated.')
         text = text [:WIKIFIER_CHARACTER_LIMIT]
-    payload = {'userKey': 'yeydkrkxbnrfxcgayvanalxesqqwja',
-               'text': text,
-               'lang': 'auto',
-               'support': 'false',
-               'ranges': 'false',
-               'includeCosines': 'true',
-               'nTopDfValuesToIgnore': 50,
-               'nWordsToIgnoreFromList': 50,
-              }
-    r = requests.post("http://www.wikifier.org/annotate-article", data=payload)
+    if annotation_cache is None:
+        return request_entities(text)
+    key = annotation_cache_key(text)
+    entities = annotation_cache.get(key)
+    if entities is None:
+        entities = request_entities(text)
+        annotation_cache.set(key, entities)
+    return entities
+
+
+def annotation_cache_key(text):
+    # Hash everything that influences the resulting entities
+    fingerprint = json.dumps([ANNOTATION_CACHE_VERSION, WIKIFIER_PARAMETERS, WIKIFIER_BLACKLIST, text], sort_keys=True)
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+def annotation_cache_report():
+    if annotation_cache is None:
+        return 'Annotation cache disabled'
+    return 'Annotation cache: ' + annotation_cache.hit_rate_report()
+
+
+def request_entities(text):
+    payload = {'userKey': 'yeydkrkxbnrfxcgayvanalxesqqwja', 'text': text, **WIKIFIER_PARAMETERS}
+    r = session.post("http://www.wikifier.org/annotate-article", data=payload)
     try:
         j = json.loads(r.text)
     except json.decoder.JSONDecodeError as err:
@@ -0,0 +1,163 @@
+import os
+import requests
+
+from wikichunkifiers.lib.util import CACHE_DIR
+from wikichunkifiers.lib.sqlite_cache import SqliteCache
+
+# Providers of the links between Wikipedia pages, which are used for clustering the concepts of a material.
+# By default, links are requested from the MediaWiki API, several pages per request, and cached on disk.
+# Alternatively, links can be read from a local adjacency file that was derived from a Wikipedia dump.
+
+WIKIPEDIA_API_URL = 'https://en.wikipedia.org/w/api.php'
+WIKIPEDIA_API_TIMEOUT = 20
+
+# Max number of titles per request that the MediaWiki API allows
+TITLES_PER_REQUEST = 50
+
+# Links change rarely, so it's fine to reuse them for a while
+LINK_CACHE_TTL_SECONDS = 30 * 24 * 3600
+LINK_CACHE_MAX_ENTRIES = 100000
+
+
+class MediaWikiLinkProvider:
+    """
+    requests links from the MediaWiki API in batches and caches them persistently
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.session = requests.Session()
+
+    def links(self, titles):
+        """Returns the titles of the articles that each page links to.
+
+        Args:
+            titles ([str]): titles of Wikipedia pages
+
+        Returns:
+            {str: [str]}: the links of each page. Titles whose links couldn't be retrieved are omitted.
+        """
+        result = {}
+        missing_titles = []
+        for title in titles:
+            links = self.cache.get(title) if self.cache is not None else None
+            if links is None:
+                missing_titles.append(title)
+            else:
+                result[title] = links
+        for start in range(0, len(missing_titles), TITLES_PER_REQUEST):
+            batch = missing_titles[start:start + TITLES_PER_REQUEST]
+            try:
+                fetched = self.fetch_links(batch)
+            except (requests.RequestException, ValueError, KeyError) as err:
+                print('Ignoring error: ', err)
+                continue
+            for title, links in fetched.items():
+                result[title] = links
+                if self.cache is not None:
+                    self.cache.set(title, links)
+        return result
+
+    def fetch_links(self, titles):
+        params = {'action': 'query',
+                  'format': 'json',
+                  'formatversion': 2,
+                  'prop': 'links',
+                  'titles': '|'.join(titles),
+                  'plnamespace': 0,  # only links to articles
+                  'pllimit': 'max',
+                  'redirects': 1,
+                  }
+        links_per_page = {}
+        aliases = {}
+        while True:
+            r = self.session.get(WIKIPEDIA_API_URL, params=params, timeout=WIKIPEDIA_API_TIMEOUT)
+            r.raise_for_status()
+            j = r.json()
+            query = j.get('query', {})
+            for alias in query.get('normalized', []) + query.get('redirects', []):
+                aliases[alias['from']] = alias['to']
+            for page in query.get('pages', []):
+                if page.get('missing') or page.get('invalid'):
+                    continue
+                page_links = links_per_page.setdefault(page['title'], [])
+                page_links += [link['title'] for link in page.get('links', [])]
+            # Pages with many links are spread over several responses
+            if 'continue' not in j:
+                break
+            params.update(j['continue'])
+        result = {}
+        for title in titles:
+            page_title = resolve_alias(title, aliases)
+            if page_title in links_per_page:
+                result[title] = links_per_page[page_title]
+        return result
+
+
+class AdjacencyFileLinkProvider:
+    """
+    reads links from a local file, for running without network access to Wikipedia
+
+    Each line of the file contains the title of a page followed by the titles of the pages it links to, separated by tabs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._links_per_page = None
+
+    def links(self, titles):
+        if self._links_per_page is None:
+            self._links_per_page = load_adjacency_file(self.path)
+        return {title: self._links_per_page[title] for title in titles if title in self._links_per_page}
+
+
+def load_adjacency_file(path):
+    links_per_page = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if fields[0]:
+                links_per_page[fields[0]] = fields[1:]
+    print('Loaded links of {} pages from {}'.format(len(links_per_page), path))
+    return links_per_page
+
+
+def resolve_alias(title, aliases):
+    # Follow normalizations and redirects, e.g. "machine_learning" -> "Machine_learning" -> "Machine learning"
+    seen = set()
+    while title in aliases and title not in seen:
+        seen.add(title)
+        title = aliases[title]
+    return title
+
+
+link_provider = MediaWikiLinkProvider(SqliteCache(os.path.join(CACHE_DIR, 'wikipedia_links.sqlite'),
+                                                  max_entries=LINK_CACHE_MAX_ENTRIES,
+                                                  ttl_seconds=LINK_CACHE_TTL_SECONDS))
+
+
+def configure_link_provider(adjacency_file_path=None, cache_path=None, cache_ttl_seconds=LINK_CACHE_TTL_SECONDS):
+    """Replaces the default link provider.
+
+    Args:
+        adjacency_file_path (str): read links from this file instead of the MediaWiki API
+        cache_path (str): sqlite file for caching links from the MediaWiki API
+        cache_ttl_seconds (int): max age of cached links. 0 disables the cache.
+    """
+    global link_provider
+    if adjacency_file_path is not None:
+        link_provider = AdjacencyFileLinkProvider(adjacency_file_path)
+    elif cache_ttl_seconds > 0:
+        link_provider = MediaWikiLinkProvider(SqliteCache(cache_path, LINK_CACHE_MAX_ENTRIES, cache_ttl_seconds))
+    else:
+        link_provider = MediaWikiLinkProvider(None)
+
+
+def get_links(titles):
+    return link_provider.links(titles)
+
+
+def link_cache_report():
+    if isinstance(link_provider, MediaWikiLinkProvider) and link_provider.cache is not None:
+        return 'Link cache: ' + link_provider.cache.hit_rate_report()
+    return 'Link cache disabled'
@@ -1,24 +1,35 @@
-import subprocess, requests, math, json
+import subprocess, requests, math, json, io, codecs
 import textwrap
 
-from wikichunkifiers.lib.util import temp_file_path, EnrichmentError, make_chunk
-from wikichunkifiers.lib.wikify import get_entities, WIKIFIER_CHARACTER_LIMIT, WIKIFIER_BLACKLIST
+from wikichunkifiers.lib.util import temp_file, EnrichmentError, make_chunk
+from wikichunkifiers.lib.wikify import get_entities_for_parts, WIKIFIER_CHARACTER_LIMIT, WIKIFIER_BLACKLIST
+
+# Downloads are written to disk in pieces of this many bytes, so that large PDFs never sit in memory as a whole
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_PDF_BYTES = 200 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+
+# pdftotext output is read and decoded in pieces of this many bytes
+READ_BLOCK_SIZE = 64 * 1024
+
 
 def extract_chunks_from_pdf(url):
     print('\nin extract_chunks_from_pdf\n')
-    download_file(url)
-    # create_thumbnail_and_post_back(url)
-    text = convert_to_text()
+    with temp_file('pdf') as path:
+        download_file(url, path)
+        # create_thumbnail_and_post_back(url)
+        text = extract_text(path)
     if len(text) < 500:
         raise EnrichmentError('Text too short')
 
     parts = split_text_into_equal_parts(text)
 
+    print('Processing', len(parts), 'chunks')
+    entities_per_part = get_entities_for_parts(parts)
+
     chunks = []
     start = 0
-    for index, part in enumerate(parts):
-        print('Processing chunk', index+1, '/', len(parts))
-        entities = get_entities(part)
+    for part, entities in zip(parts, entities_per_part):
         length = len(part) / len(text)
         chunk = make_chunk(start, length, entities, part)
         # print(json.dumps(chunk, indent=4, sort_keys=True))
@@ -27,28 +38,45 @@ def extract_chunks_from_pdf(url):
     return chunks
 
 
-def download_file(url):
+def download_file(url, path):
     print('Downloading...')
-    r = requests.get(url)
-    if r.status_code != 200:
-        raise EnrichmentError('Download failed with status '+str(r.status_code))
-    with open(pdf_path(), 'wb') as f:
-        f.write(r.content)
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        if r.status_code != 200:
+            raise EnrichmentError('Download failed with status '+str(r.status_code))
+        if int(r.headers.get('Content-Length', 0)) > MAX_PDF_BYTES:
+            raise EnrichmentError('PDF too large')
+        size = 0
+        with open(path, 'wb') as f:
+            for data in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                size += len(data)
+                if size > MAX_PDF_BYTES:
+                    raise EnrichmentError('PDF too large')
+                f.write(data)
 
 
-def convert_to_text():
+def extract_text(path):
+    """Converts a PDF to text with a single pdftotext process, decoding its output as it arrives.
+
+    The chunker needs the length of the whole text to split it into equal parts, so the text is returned at once.
+    Decoding piece by piece avoids keeping the raw output next to the text.
+    """
     args = ["pdftotext",
             '-enc',
             'UTF-8',
-            pdf_path(),
+            path,
             '-',
             ]
-    res = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    try:
-        text = res.stdout.decode('utf-8')
-    except UnicodeDecodeError as err:
-        raise EnrichmentError('UnicodeDecodeError after pdf conversion')
-    return text
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        text = io.StringIO()
+        try:
+            for block in iter(lambda: process.stdout.read(READ_BLOCK_SIZE), b''):
+                text.write(decoder.decode(block))
+            text.write(decoder.decode(b'', final=True))
+        except UnicodeDecodeError as err:
+            process.kill()
+            raise EnrichmentError('UnicodeDecodeError after pdf conversion')
+    return text.getvalue()
 
 
 def split_text_into_equal_parts(text):
@@ -61,13 +89,9 @@ def split_text_into_equal_parts(text):
     return [ text[i:i+chunksize] for i in range(0, len(text), chunksize) ]
 
 
-def pdf_path():
-    return temp_file_path('pdf')
-
-
 # def create_thumbnail_and_post_back(url):
 #     args = ["/usr/local/bin/convert",
-#             pdf_path(),
+#             path,
 #             ]
 #     subprocess.check_call(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 #     res = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
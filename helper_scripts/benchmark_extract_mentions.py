@@ -0,0 +1,152 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+# For the enrichment imports to work when running this script from the helper_scripts folder
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'enrichment'))
+
+import enrichment_worker
+from wikichunkifiers.lib import language
+
+# Benchmark for extract_mentions on a long synthetic transcript.
+# Compares the current implementation with the previous one, which ran a separate regex search
+# for every (entity, chunk) pair and rescanned the chunk for end marks for every mention,
+# and checks that both produce the same mentions.
+# By default, language detection is switched off in both versions.
+# With --detect-languages, the previous version checks every sentence with langdetect,
+# whereas the current one classifies whole chunks first. The mentions may then differ slightly.
+
+# Usage:
+# python helper_scripts/benchmark_extract_mentions.py --pages 200 --entities 300
+# python helper_scripts/benchmark_extract_mentions.py --pages 50 --detect-languages
+
+
+WORDS = 'the of and a to in is we can see that this for which are with as on be by it an model data'.split()
+
+
+def make_chunks(n_pages, n_entities, seed):
+    rng = random.Random(seed)
+    entities = [{'id': 'Q{}'.format(index), 'title': 'Concept {} (topic)'.format(index), 'url': ''}
+                for index in range(n_entities)]
+    chunks = []
+    for page in range(n_pages):
+        sentences = []
+        for _ in range(40):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(5, 20))]
+            if rng.random() < 0.3:
+                words.insert(rng.randrange(len(words)), 'concept {}'.format(rng.randrange(n_entities)))
+            sentences.append(' '.join(words).capitalize() + rng.choice(['.', '?', '!', ',']))
+        chunks.append({'start': page, 'length': 1, 'text': '  '.join(sentences),
+                       'entities': rng.sample(entities, 5)})
+    return chunks
+
+
+def extract_mentions_before(chunks):
+    # The implementation before the single-pass search and the sentence index, for reference
+    mentions = {}
+    entities = []
+    for chunk in chunks:
+        entities += chunk['entities']
+    entities = list({v['id']: v for v in entities}.values())
+    entities = [e for e in entities if len(e['title']) > 1]
+    for entity in entities:
+        entity_id = entity['id']
+        title = entity['title'].lower()
+        title = enrichment_worker.remove_stuff_in_parentheses(title)
+        title = title.strip()
+        for chunk in chunks:
+            text = chunk['text']
+            text = re.sub(r'\s+', ' ', text)
+            positions = [m.start() for m in re.finditer(re.escape(title), text.lower())]
+            prev_position = None
+            for position in positions:
+                position += int(len(title) / 2)
+                if prev_position is not None and position - prev_position < 200 and not contains_end_mark(
+                        text[prev_position:position]):
+                    continue
+                prev_position = position
+                sentence, pos_in_chunk = sentence_at_position(text, position)
+                if len(sentence) > 200:
+                    sentence, pos_in_chunk = excerpt_at_position(text, position)
+                if not looks_like_english(sentence):
+                    continue
+                position_in_resource = round(chunk['start'] + chunk['length'] * pos_in_chunk / len(text), 4)
+                if entity_id not in mentions:
+                    mentions[entity_id] = []
+                if len(mentions[entity_id]) == 0 or mentions[entity_id][-1]['positionInResource'] != position_in_resource:
+                    mentions[entity_id].append({'sentence': sentence, 'positionInResource': position_in_resource})
+    return mentions
+
+
+def looks_like_english(sentence):
+    lang, prob = language.detect_language(sentence)
+    return lang == 'en' and prob > 0.9
+
+
+def contains_end_mark(text):
+    return re.search(r'[.?!]', text)
+
+
+def sentence_at_position(text, position):
+    end_mark_positions = [m.start() for m in re.finditer('[.!?]([ ]|$)', text)]
+    if len(end_mark_positions) == 0:
+        return text, 0
+    sentence_start_position = 0
+    for end_mark_position in end_mark_positions:
+        if end_mark_position > position:
+            return text[sentence_start_position:(end_mark_position + 1)], sentence_start_position
+        sentence_start_position = end_mark_position + 1
+    return text[sentence_start_position:], sentence_start_position
+
+
+def excerpt_at_position(text, position):
+    start_pos = max(0, position - 70)
+    end_pos = position + 80
+    words = text[start_pos:end_pos].split(' ')
+    excerpt = ' '.join(words[1:-1])
+    return '…' + excerpt + '…', start_pos
+
+
+def timed(function, chunks):
+    start = time.time()
+    result = function(chunks)
+    return result, time.time() - start
+
+
+class AcceptEverything:
+    def __init__(self, chunk_text):
+        pass
+
+    def accepts(self, sentence):
+        return True
+
+
+def main(args):
+    if args.detect_languages:
+        language.set_deterministic()
+    else:
+        global looks_like_english
+        looks_like_english = lambda sentence: True
+        enrichment_worker.EnglishFilter = AcceptEverything
+    chunks = make_chunks(args.pages, args.entities, args.seed)
+    before, seconds_before = timed(extract_mentions_before, chunks)
+    after, seconds_after = timed(enrichment_worker.extract_mentions, chunks)
+    if args.detect_languages:
+        print('identical mentions:', before == after)
+    else:
+        assert before == after, 'The mentions differ'
+    print('{} pages, {} entities, {} mentions'.format(args.pages, args.entities, sum(len(m) for m in after.values())))
+    print('before: {:.2f}s'.format(seconds_before))
+    print('after:  {:.2f}s'.format(seconds_after))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark for extracting entity mentions from a long transcript')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--entities', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--detect-languages', action='store_true')
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# For relative imports to work when running this script from the helper_scripts folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from x5learn_server.interval_set import IntervalSet
+
+# Benchmark for merging reported video play positions into watched ranges.
+# Compares the previous video_usage_ranges_from_positions, which sorted all positions of a video
+# on every request, with building an IntervalSet from the same positions (as the rebuild does),
+# and checks that both produce the same ranges. Then times adding further positions one by one
+# to the IntervalSet, which is what logging a video play action costs now.
+# The positions are spread over a long video, so that many separate ranges remain.
+
+# Usage:
+# python helper_scripts/benchmark_interval_set.py --positions 1000000 --duration 36000000
+
+VIDEO_PLAY_REPORTING_INTERVAL = 10
+
+
+# Previous implementation, from x5learn_server/app.py
+def video_usage_ranges_from_positions(positions):
+    ranges = []
+    positions = sorted(positions)
+    for index, position in enumerate(positions):
+        if index > 0 and position >= ranges[-1]['start'] and position < ranges[-1]['start'] + ranges[-1][
+            'length'] + VIDEO_PLAY_REPORTING_INTERVAL:
+            # extend the last range
+            ranges[-1]['length'] = position - ranges[-1]['start'] + VIDEO_PLAY_REPORTING_INTERVAL
+        else:
+            # add a new range
+            ranges.append({'start': position, 'length': VIDEO_PLAY_REPORTING_INTERVAL})
+    return ranges
+
+
+def ranges_from_positions(positions):
+    return IntervalSet.from_positions(positions, VIDEO_PLAY_REPORTING_INTERVAL, min_gap=VIDEO_PLAY_REPORTING_INTERVAL)
+
+
+def add_positions(ranges, positions):
+    for position in positions:
+        ranges.add(position, position + VIDEO_PLAY_REPORTING_INTERVAL)
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    positions = [rng.uniform(0, args.duration) for _ in range(args.positions)]
+
+    before, seconds_before = timed(video_usage_ranges_from_positions, positions)
+    after, seconds_after = timed(ranges_from_positions, positions)
+    assert [(r['start'], r['start'] + r['length']) for r in before] == list(after), 'The ranges differ'
+
+    # the previous version sorted all positions again whenever one more was logged
+    more_positions = [rng.uniform(0, args.duration) for _ in range(args.more_positions)]
+    _, seconds_one_before = timed(video_usage_ranges_from_positions, positions + more_positions[:1])
+    _, seconds_more_after = timed(add_positions, after, more_positions)
+    assert list(after) == list(ranges_from_positions(positions + more_positions)), 'The ranges differ'
+
+    print('{} positions, {} ranges, {:.1f}% covered'.format(args.positions, len(after),
+                                                           after.coverage_percentage(0, args.duration)))
+    print('all positions  before: {:.2f}s  after: {:.2f}s'.format(seconds_before, seconds_after))
+    print('one more       before: {:.2f}s  after: {:.6f}s (average of {})'.format(
+        seconds_one_before, seconds_more_after / args.more_positions, args.more_positions))
+    print('serialized size: {} values'.format(len(after.serialize())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark for merging video play positions into watched ranges')
+    parser.add_argument('--positions', type=int, default=1000000)
+    parser.add_argument('--duration', type=float, default=36000000)
+    parser.add_argument('--more-positions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
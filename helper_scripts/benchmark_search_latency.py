@@ -0,0 +1,127 @@
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# For relative imports to work when running this script from the helper_scripts folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from x5learn_server import x5gon_api
+
+# Benchmark for the X5GON part of /api/v1/search/ which dominates its latency.
+# Starts a local stub of the X5GON API that answers every request after a fixed delay, then runs the same search with:
+# - the previous implementation (a copy below), which walked the pages one by one with a new connection per request
+#   and fetched the captions of each material in turn,
+# - the current search_materials limited to one request at a time (max_workers=1), which still requests
+#   several pages per round and reuses connections,
+# - the current search_materials with the default settings.
+# Only the requests to the X5GON API are timed. The database work of /api/v1/search/
+# (creating the OERs and pushing enrichment tasks) is not part of this benchmark.
+
+# Usage:
+# python helper_scripts/benchmark_search_latency.py --latency 0.08 --runs 30
+
+
+class StubX5gonApi(BaseHTTPRequestHandler):
+    latency = 0.05
+    results_per_page = 10
+    total_pages = 5
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = urlparse(self.path)
+        if path.path.endswith('/search/'):
+            page = int(parse_qs(path.query)['page'][0])
+            body = {'metadata': {'total_pages': self.total_pages},
+                    'rec_materials': [self.material(page, index) for index in range(self.results_per_page)]}
+        else:
+            body = {'oer_contents': [{'extension': 'webvtt', 'language': 'en', 'value': {'value': 'WEBVTT'}}]}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def material(self, page, index):
+        material_id = page * 1000 + index
+        # every third result is a pdf, which gets filtered out
+        suffix = 'pdf' if index % 3 == 2 else 'mp4'
+        return {'material_id': material_id, 'url': 'http://example.org/{}.{}'.format(material_id, suffix)}
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# Previous implementation from x5learn_server/app.py, without the database steps
+def search_materials_before(text, max_results, page_number=1, materials=None):
+    materials = [] if materials is None else materials
+    address = urlparse(x5gon_api.X5GON_PLATFORM_URL)
+    conn = http.client.HTTPConnection(address.netloc)
+    conn.request('GET', address.path + x5gon_api.SEARCH_ENDPOINT.format(text, page_number))
+    response = conn.getresponse().read().decode("utf-8")
+    metadata = json.loads(response)['metadata']
+    page_materials = x5gon_api.filter_x5gon_search_results(json.loads(response)['rec_materials'])
+    for material in page_materials:
+        if len(material['url']) > 255:
+            continue
+        materials.append(fetch_captions_before(material))
+    materials = materials[:max_results]
+    if page_number > metadata['total_pages']:
+        return materials
+    if len(materials) >= max_results:
+        return materials
+    return search_materials_before(text, max_results, page_number + 1, materials)
+
+
+def fetch_captions_before(material):
+    contents = requests.get(x5gon_api.X5GON_PLATFORM_URL +
+                            x5gon_api.CAPTIONS_ENDPOINT.format(material['material_id'])).json()
+    material['translations'] = {}
+    for content in contents['oer_contents']:
+        if content['extension'] != 'webvtt':
+            continue
+        material['translations'][content['language']] = content.get('value', '').get('value', '')
+    return material
+
+
+def measure(runs, search):
+    durations = []
+    for _ in range(runs):
+        t = time.time()
+        materials = search('benchmark', 18)
+        durations.append(time.time() - t)
+    assert len(materials) == 18
+    return durations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark X5GON search latency against a local stub API')
+    parser.add_argument('--latency', default=0.05, type=float, help='seconds the stub waits before each response')
+    parser.add_argument('--runs', default=20, type=int, help='number of searches per configuration')
+    args = parser.parse_args()
+
+    StubX5gonApi.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubX5gonApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    x5gon_api.X5GON_PLATFORM_URL = 'http://127.0.0.1:{}/api/v1'.format(server.server_address[1])
+
+    searches = [('before', search_materials_before),
+                ('after, max_workers=1', lambda text, n: x5gon_api.search_materials(text, n, max_workers=1)),
+                ('after', x5gon_api.search_materials)]
+    for label, search in searches:
+        durations = measure(args.runs, search)
+        print('{:<22} p50 = {:6.0f} ms   p99 = {:6.0f} ms'.format(label, percentile(durations, 50) * 1000,
+                                                                  percentile(durations, 99) * 1000))
+    server.shutdown()
@@ -19,6 +19,18 @@ HEADERS = {
 }
 
 ENDPOINT = 'ingest_oer/'
+EXISTING_ENDPOINT = 'existing_material_ids/'
+
+# Number of material_ids that are checked for existing OERs with one request
+BATCH_SIZE = 1000
+
+
+def existing_material_ids(material_ids):
+    response = requests.post(API_URL + EXISTING_ENDPOINT,
+                             headers=HEADERS,
+                             data=json.dumps({'material_ids': material_ids}))
+    response.raise_for_status()
+    return set(response.json()['material_ids'])
 
 if __name__ == '__main__':
     parser=argparse.ArgumentParser(
@@ -28,17 +40,23 @@ if __name__ == '__main__':
     parser.add_argument('end', type=str, help='last material_id in the range. Must be >= start')
     args=parser.parse_args()
 
-    material_id = int(args.start)
+    start_id = int(args.start)
     end_id = int(args.end)
-    while material_id <= end_id:
-        print('\n______________________________________________________________')
-        print('material_id', material_id)
-        data = {'material_id': material_id}
-        response = requests.post(API_URL + ENDPOINT,
-                             headers= HEADERS,
-                             data=json.dumps(data))
-        if response.ok:
-            print(response.json())
-        else:
-            print(response.status_code, response.reason)
-        material_id += 1
+    for batch_start in range(start_id, end_id + 1, BATCH_SIZE):
+        batch = list(range(batch_start, min(batch_start + BATCH_SIZE, end_id + 1)))
+        # skip material_ids that exist already, so that we don't need a request for each of them
+        existing = existing_material_ids(batch)
+        print('\n{} of material_ids {}-{} EXIST'.format(len(existing), batch[0], batch[-1]))
+        for material_id in batch:
+            if material_id in existing:
+                continue
+            print('\n______________________________________________________________')
+            print('material_id', material_id)
+            data = {'material_id': material_id}
+            response = requests.post(API_URL + ENDPOINT,
+                                 headers= HEADERS,
+                                 data=json.dumps(data))
+            if response.ok:
+                print(response.json())
+            else:
+                print(response.status_code, response.reason)
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from x5learn_server import action_logging
+from x5learn_server.action_logging import parse_actions, InvalidActionsError, WriteBehindActionWriter, \
+    setting_from_action
+
+
+def test_parse_actions_returns_one_row_per_action():
+    rows = parse_actions([4, 5], ['{"oerId": 1}', '{"oerId": 2}'], 7)
+
+    assert [(row['action_type_id'], row['params'], row['user_login_id']) for row in rows] == \
+           [(4, {'oerId': 1}, 7), (5, {'oerId': 2}, 7)]
+
+
+def test_parse_actions_rejects_the_whole_bundle_if_one_action_is_invalid():
+    with pytest.raises(InvalidActionsError):
+        parse_actions([4, 5], ['{"oerId": 1}', 'not json'], 7)
+    with pytest.raises(InvalidActionsError):
+        parse_actions([4, 5], ['{"oerId": 1}'], 7)
+
+
+def test_write_behind_writer_flushes_full_batches(monkeypatch):
+    batches = []
+    written = threading.Event()
+
+    def insert_actions(rows):
+        batches.append(rows)
+        written.set()
+
+    monkeypatch.setattr(action_logging, 'insert_actions', insert_actions)
+    monkeypatch.setattr(action_logging.db_session, 'remove', lambda: None)
+    writer = WriteBehindActionWriter(max_batch_size=2, flush_interval_seconds=60)
+
+    writer.write([{'action_type_id': 4}])
+    writer.write([{'action_type_id': 5}])
+
+    assert written.wait(5)
+    assert batches == [[{'action_type_id': 4}, {'action_type_id': 5}]]
+
+
+def test_write_behind_writer_keeps_the_valid_writes_of_a_failed_batch(monkeypatch):
+    batches = []
+
+    def insert_actions(rows):
+        if any(row['action_type_id'] == 999 for row in rows):
+            raise ValueError('unknown action type')
+        batches.append(rows)
+
+    monkeypatch.setattr(action_logging, 'insert_actions', insert_actions)
+    monkeypatch.setattr(action_logging.db_session, 'rollback', lambda: None)
+    monkeypatch.setattr(action_logging.db_session, 'remove', lambda: None)
+    writer = WriteBehindActionWriter(max_batch_size=100, flush_interval_seconds=60)
+
+    writer.write([{'action_type_id': 4}])
+    writer.write([{'action_type_id': 999}])
+    writer.write([{'action_type_id': 5}])
+    writer.flush()
+
+    assert batches == [[{'action_type_id': 4}], [{'action_type_id': 5}]]
+
+
+def test_setting_from_action_maps_setting_actions_to_user_setting_columns():
+    assert setting_from_action(7, {'enable': False}) == ('content_flow_enabled', False)
+    assert setting_from_action(10, {'selectedMode': 'list'}) == ('overview_type', 'list')
+    assert setting_from_action(4, {'oerId': 1}) is None
+    assert setting_from_action(7, {}) is None
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from x5learn_server.interval_set import IntervalSet
+
+# Property tests on random intervals with integer bounds, compared with a brute-force model
+# that marks every covered unit of a small range.
+SEED = 0
+RUNS = 300
+MAX_POSITION = 100
+
+
+def random_intervals(rng, count):
+    intervals = []
+    for _ in range(count):
+        start = rng.randint(0, MAX_POSITION)
+        intervals.append((start, start + rng.randint(0, 15)))
+    return intervals
+
+
+def expected_intervals(intervals, min_gap):
+    # sorts the intervals and joins neighbours that are less than min_gap apart, or adjacent
+    result = []
+    for start, end in sorted(intervals):
+        if result and (start <= result[-1][1] or start - result[-1][1] < min_gap):
+            result[-1] = (result[-1][0], max(result[-1][1], end))
+        else:
+            result.append((start, end))
+    return result
+
+
+def covered_units(intervals):
+    return {unit for start, end in intervals for unit in range(start, end)}
+
+
+@pytest.mark.parametrize('min_gap', [0, 1, 10])
+def test_adding_intervals_in_any_order_gives_sorted_disjoint_intervals(min_gap):
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        intervals = random_intervals(rng, rng.randint(0, 30))
+        interval_set = IntervalSet(intervals, min_gap=min_gap)
+
+        assert list(interval_set) == expected_intervals(intervals, min_gap)
+        starts_and_ends = interval_set.serialize()
+        assert starts_and_ends == sorted(starts_and_ends)
+
+
+def test_intervals_cover_the_same_units_as_the_added_intervals():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        intervals = random_intervals(rng, rng.randint(0, 30))
+        interval_set = IntervalSet(intervals)
+
+        assert covered_units(interval_set) == covered_units(intervals)
+        assert interval_set.total_length() == len(covered_units(intervals))
+
+
+def test_union_equals_adding_all_intervals_to_one_set():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        first = random_intervals(rng, rng.randint(0, 15))
+        second = random_intervals(rng, rng.randint(0, 15))
+
+        assert IntervalSet(first, min_gap=5).union(IntervalSet(second, min_gap=5)) == \
+            IntervalSet(first + second, min_gap=5)
+
+
+def test_coverage_percentage_matches_covered_units():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        interval_set = IntervalSet(random_intervals(rng, rng.randint(0, 10)))
+        start = rng.randint(0, MAX_POSITION)
+        end = start + rng.randint(1, 50)
+
+        expected = 100.0 * len(covered_units(interval_set) & set(range(start, end))) / (end - start)
+        assert interval_set.coverage_percentage(start, end) == pytest.approx(expected)
+
+
+def test_serialized_intervals_can_be_restored():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        interval_set = IntervalSet(random_intervals(rng, rng.randint(0, 30)), min_gap=3)
+
+        restored = IntervalSet.deserialize(interval_set.serialize(), min_gap=3)
+        assert restored == interval_set
+        restored.add(0, 1)
+        assert restored == IntervalSet(list(interval_set) + [(0, 1)], min_gap=3)
+
+
+def test_interval_that_ends_before_it_starts_is_rejected():
+    with pytest.raises(ValueError):
+        IntervalSet().add(5, 4)
+
+
+def test_from_positions_equals_adding_fixed_length_intervals():
+    rng = random.Random(SEED)
+    for _ in range(RUNS):
+        positions = [rng.uniform(0, MAX_POSITION) for _ in range(rng.randint(0, 30))]
+        interval_set = IntervalSet(min_gap=10)
+        for position in positions:
+            interval_set.add(position, position + 10)
+
+        assert IntervalSet.from_positions(positions, 10, min_gap=10) == interval_set
@@ -0,0 +1,103 @@
+import threading
+
+from sqlalchemy.dialects import postgresql
+
+from x5learn_server import search_cache
+from x5learn_server.search_cache import SearchCache, InProcessSearchCacheBackend, DatabaseSearchCacheBackend, \
+    normalize_search_text
+
+
+def test_normalize_search_text():
+    assert normalize_search_text('  Machine   Learning ') == 'machine learning'
+
+
+def test_search_cache_hit_and_miss():
+    cache = SearchCache(InProcessSearchCacheBackend(10), 60)
+    searches = []
+
+    def search(text):
+        searches.append(text)
+        return [1, 2, 3]
+
+    assert cache.get_oer_ids('physics', search) == [1, 2, 3]
+    assert cache.get_oer_ids('Physics ', search) == [1, 2, 3]
+    assert searches == ['physics']
+    assert cache.stats()['thisProcess']['hits'] == 1
+    assert cache.stats()['thisProcess']['misses'] == 1
+
+
+def test_search_cache_evicts_least_recently_used():
+    cache = SearchCache(InProcessSearchCacheBackend(2), 60)
+    cache.get_oer_ids('a', lambda text: [1])
+    cache.get_oer_ids('b', lambda text: [2])
+    cache.get_oer_ids('a', lambda text: [1])
+    cache.get_oer_ids('c', lambda text: [3])
+
+    assert cache.get_oer_ids('a', lambda text: [4]) == [1]
+    assert cache.get_oer_ids('b', lambda text: [5]) == [5]
+
+
+def test_search_cache_serves_stale_entries_while_refreshing():
+    cache = SearchCache(InProcessSearchCacheBackend(10), -1)
+    refreshed = threading.Event()
+
+    def refresh(text):
+        refreshed.set()
+        return [2]
+
+    cache.get_oer_ids('chemistry', lambda text: [1])
+
+    assert cache.get_oer_ids('chemistry', refresh) == [1]
+    assert refreshed.wait(5)
+    assert cache.stats()['thisProcess']['staleHits'] == 1
+
+
+class FakeSession:
+    """records the statements of DatabaseSearchCacheBackend.set instead of running them"""
+
+    def __init__(self, fail=False):
+        self.statements = []
+        self.rolled_back = False
+        self._fail = fail
+
+    def execute(self, statement):
+        if self._fail:
+            raise ValueError('database unavailable')
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+
+    def query(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def offset(self, *args):
+        return self
+
+    def all(self):
+        return []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_database_backend_upserts_entries(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(search_cache, 'db_session', session)
+
+    DatabaseSearchCacheBackend(10).set('physics', [1, 2], 100.0)
+
+    assert 'ON CONFLICT (search_text) DO UPDATE' in session.statements[0]
+
+
+def test_search_results_are_returned_if_the_cache_write_fails(monkeypatch):
+    session = FakeSession(fail=True)
+    monkeypatch.setattr(search_cache, 'db_session', session)
+    monkeypatch.setattr(DatabaseSearchCacheBackend, 'get', lambda self, key: None)
+    cache = SearchCache(DatabaseSearchCacheBackend(10), 60)
+
+    assert cache.get_oer_ids('physics', lambda text: [1, 2]) == [1, 2]
+    assert session.rolled_back
@@ -0,0 +1,73 @@
+import socket
+import threading
+
+from x5learn_server.task_notifications import TaskNotifier, PostgresTaskNotifier, CHANNEL
+
+
+def test_task_notifier_wait_times_out_without_signal():
+    notifier = TaskNotifier()
+
+    assert not notifier.wait(notifier.generation, 0.01)
+
+
+def test_task_notifier_wakes_up_waiters():
+    notifier = TaskNotifier()
+    generation = notifier.generation
+    threading.Timer(0.01, notifier.publish).start()
+
+    assert notifier.wait(generation, 5)
+
+
+def test_task_notifier_does_not_miss_signals_sent_before_waiting():
+    notifier = TaskNotifier()
+    generation = notifier.generation
+    notifier.publish()
+
+    assert notifier.wait(generation, 0)
+
+
+class FakeListenConnection:
+    """stands in for the detached psycopg2 connection that the listener uses"""
+
+    def __init__(self):
+        self.connection = self
+        self.notifies = []
+        self.statements = []
+        self._reader, self._writer = socket.socketpair()
+
+    def detach(self):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def poll(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def raw_connection(self):
+        return self._connection
+
+
+def test_postgres_task_notifier_wakes_up_waiters_once_it_listens():
+    connection = FakeListenConnection()
+    notifier = PostgresTaskNotifier(FakeEngine(connection))
+    # a worker that looked for tasks before the listener was connected
+    generation = notifier.generation
+    notifier.start_listener()
+
+    assert notifier.wait(generation, 5)
+    assert connection.statements == ['LISTEN ' + CHANNEL]
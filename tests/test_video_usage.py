@@ -0,0 +1,16 @@
+from x5learn_server.video_usage import ranges_from_positions, position_from_action, serialize_ranges, \
+    VIDEO_PLAY_REPORTING_INTERVAL
+
+
+def test_positions_less_than_an_interval_apart_are_joined():
+    assert list(ranges_from_positions([40, 0, 10, 15])) == [(0, 25), (40, 40 + VIDEO_PLAY_REPORTING_INTERVAL)]
+
+
+def test_ranges_are_serialized_in_the_format_of_the_frontend():
+    assert serialize_ranges(ranges_from_positions([0, 10])) == [{'start': 0, 'length': 20}]
+
+
+def test_position_from_action_ignores_other_actions():
+    assert position_from_action(9, {'oerId': 3, 'positionInSeconds': 12.5}) == (3, 12.5)
+    assert position_from_action(7, {'enable': True}) is None
+    assert position_from_action(4, {'oerId': 3}) is None
@@ -39,3 +39,16 @@ MAIL_PORT = int(os.environ["X5LEARN_MAIL_PORT"])
 
 # Getting server name
 SERVER_NAME = os.environ.get("SERVER_NAME") or "145.14.12.67:6001"
+
+# Search result cache. "memory" keeps the cache inside each worker process,
+# "database" shares it between all workers via the search_cache_entry table.
+# Either way, the hit and miss counters in /api/v1/search_cache_stats/ are those of the process that answers.
+SEARCH_CACHE_BACKEND = os.environ.get("X5LEARN_SEARCH_CACHE_BACKEND") or "memory"
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("X5LEARN_SEARCH_CACHE_MAX_ENTRIES") or 1000)
+SEARCH_CACHE_TTL_SECONDS = int(os.environ.get("X5LEARN_SEARCH_CACHE_TTL_SECONDS") or 24 * 60 * 60)
+
+# Action logging. "sync" writes actions within the request,
+# "write_behind" queues them in memory and writes them in batches from a background thread.
+ACTION_LOGGING_MODE = os.environ.get("X5LEARN_ACTION_LOGGING_MODE") or "sync"
+ACTION_WRITE_BEHIND_MAX_BATCH = int(os.environ.get("X5LEARN_ACTION_WRITE_BEHIND_MAX_BATCH") or 500)
+ACTION_WRITE_BEHIND_INTERVAL_SECONDS = float(os.environ.get("X5LEARN_ACTION_WRITE_BEHIND_INTERVAL_SECONDS") or 1)
@@ -0,0 +1,155 @@
+import atexit
+import datetime
+import json
+import threading
+
+from sqlalchemy.dialects.postgresql import insert
+
+from x5learn_server.db.database import db_session
+from x5learn_server.models import Action, UserSetting
+from x5learn_server.video_usage import update_video_usages
+
+# Action types that change a user setting, and the user_setting column that they update
+CONTENT_FLOW_SETTING_ACTION_TYPE_ID = 7
+OVERVIEW_TYPE_SETTING_ACTION_TYPE_ID = 10
+
+
+class InvalidActionsError(ValueError):
+    pass
+
+
+def parse_actions(action_type_ids, params_list, user_login_id):
+    """validates a bundle of actions up front, so that either all or none of them are logged.
+
+    Args:
+        action_type_ids (list(int)): action type id of each action
+        params_list (list(str)): JSON-encoded params of each action
+        user_login_id (int): user who performed the actions
+
+    Returns:
+        (list(dict)): rows for the action table
+
+    """
+    if len(action_type_ids) != len(params_list):
+        raise InvalidActionsError('One or more arguments were found missing.')
+    rows = []
+    for action_type_id, params in zip(action_type_ids, params_list):
+        if not action_type_id:
+            raise InvalidActionsError('Action type id is required')
+        try:
+            params = json.loads(params)
+        except (TypeError, ValueError):
+            raise InvalidActionsError('Invalid params for action type {}'.format(action_type_id))
+        rows.append({'action_type_id': action_type_id,
+                     'params': params,
+                     'user_login_id': user_login_id,
+                     'created_at': datetime.datetime.utcnow()})
+    return rows
+
+
+def insert_actions(rows):
+    """writes actions with a single multi-row insert and updates the affected user settings and watched video ranges
+    in the same transaction."""
+    if not rows:
+        return
+    db_session.execute(Action.__table__.insert().values(rows))
+    update_user_settings(rows)
+    update_video_usages(rows)
+    db_session.commit()
+
+
+def update_user_settings(rows):
+    # the last action of a type determines the setting, like when the settings were derived from the action history
+    settings_per_user = {}
+    for row in rows:
+        setting = setting_from_action(row['action_type_id'], row['params'])
+        if setting is not None:
+            column, value = setting
+            settings_per_user.setdefault(row['user_login_id'], {})[column] = value
+    for user_login_id, settings in settings_per_user.items():
+        statement = insert(UserSetting.__table__).values(user_login_id=user_login_id, **settings)
+        db_session.execute(statement.on_conflict_do_update(index_elements=['user_login_id'], set_=settings))
+
+
+def setting_from_action(action_type_id, params):
+    if not isinstance(params, dict):
+        return None
+    if action_type_id == CONTENT_FLOW_SETTING_ACTION_TYPE_ID and 'enable' in params:
+        return 'content_flow_enabled', bool(params['enable'])
+    if action_type_id == OVERVIEW_TYPE_SETTING_ACTION_TYPE_ID and 'selectedMode' in params:
+        return 'overview_type', params['selectedMode']
+    return None
+
+
+class SynchronousActionWriter:
+    """
+    writes actions within the request
+    """
+
+    def write(self, rows):
+        insert_actions(rows)
+
+    def flush(self):
+        pass
+
+
+class WriteBehindActionWriter:
+    """
+    queues actions in memory and writes them from a background thread,
+    once max_batch_size actions have accumulated or after flush_interval_seconds at the latest.
+
+    Queued actions are lost if the process is killed, so this is only suitable for high-volume events.
+    """
+
+    def __init__(self, max_batch_size, flush_interval_seconds):
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        # the rows of each write, so that a bad write doesn't cost the actions of other requests
+        self._bundles = []
+        self._queued = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def write(self, rows):
+        with self._condition:
+            self._bundles.append(rows)
+            self._queued += len(rows)
+            if self._queued >= self.max_batch_size:
+                self._condition.notify()
+
+    def flush(self):
+        with self._condition:
+            bundles, self._bundles, self._queued = self._bundles, [], 0
+        if not bundles:
+            return
+        try:
+            insert_actions([row for rows in bundles for row in rows])
+        except Exception as err:
+            db_session.rollback()
+            print('Failed to write {} queued actions at once, writing them separately: {}'.format(
+                sum(len(rows) for rows in bundles), err))
+            for rows in bundles:
+                try:
+                    insert_actions(rows)
+                except Exception as err:
+                    db_session.rollback()
+                    print('Failed to write {} queued actions: {}'.format(len(rows), err))
+        finally:
+            db_session.remove()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queued >= self.max_batch_size,
+                                         self.flush_interval_seconds)
+            self.flush()
+
+
+def create_action_writer(mode, max_batch_size, flush_interval_seconds):
+    if mode == 'write_behind':
+        return WriteBehindActionWriter(max_batch_size, flush_interval_seconds)
+    if mode == 'sync':
+        return SynchronousActionWriter()
+    raise ValueError('Unknown action logging mode: ' + mode)
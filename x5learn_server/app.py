@@ -7,10 +7,9 @@ import os  # apologies
 import requests
 import http.client
 import urllib
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
 from dateutil import parser
-from sqlalchemy import or_, and_, cast, Integer
+from sqlalchemy import cast, Integer
 from sqlalchemy.orm.attributes import flag_modified
 from flask_restplus import Api, Resource, fields, reqparse
 import wikipedia
@@ -18,18 +17,25 @@ import wikipedia
 # instantiate the user management db classes
 # NOTE WHEN PEP8'ING MODULE IMPORTS WILL MOVE TO THE TOP AND CAUSE EXCEPTION
 from x5learn_server._config import DB_ENGINE_URI, PASSWORD_SECRET, MAIL_SENDER, MAIL_USERNAME, MAIL_PASS, MAIL_SERVER, \
-    MAIL_PORT, LATEST_API_VERSION, SERVER_NAME
+    MAIL_PORT, LATEST_API_VERSION, SERVER_NAME, SEARCH_CACHE_BACKEND, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS, \
+    ACTION_LOGGING_MODE, ACTION_WRITE_BEHIND_MAX_BATCH, ACTION_WRITE_BEHIND_INTERVAL_SECONDS
 from x5learn_server.db.database import get_or_create_db
 
 _ = get_or_create_db(DB_ENGINE_URI)
 from x5learn_server.db.database import db_session
 from x5learn_server.models import UserLogin, Role, User, Oer, WikichunkEnrichment, WikichunkEnrichmentTask, \
-    EntityDefinition, ResourceFeedback, Action, ActionType, Repository, \
-    ActionsRepository, UserRepository, DefinitionsRepository, Course, UiLogBatch, Note
+    EntityDefinition, ResourceFeedback, ActionType, Repository, \
+    ActionsRepository, UserRepository, DefinitionsRepository, OerRepository, Course, UiLogBatch, Note, \
+    UserSetting, material_id_from_oer_data
 
-from x5learn_server.enrichment_tasks import push_enrichment_task_if_needed, push_enrichment_task, save_enrichment
+from x5learn_server.enrichment_tasks import push_enrichment_tasks_if_needed, push_enrichment_task, \
+    push_enrichment_tasks, save_enrichment, wait_for_enrichment_tasks, start_claimed_enrichment_task
 from x5learn_server.lab_study import frozen_search_results_for_lab_study, is_special_search_key_for_lab_study
 from x5learn_server.course_optimization import optimize_course
+from x5learn_server.x5gon_api import search_materials
+from x5learn_server.search_cache import create_search_cache, normalize_search_text
+from x5learn_server.action_logging import create_action_writer, parse_actions, InvalidActionsError
+from x5learn_server.video_usage import get_video_usages, serialize_ranges
 
 # Create app
 app = Flask(__name__)
@@ -82,9 +88,11 @@ USE_RECOMMENDATIONS_FROM_LAM = True  # if true, uses the new solution see #290
 SUPPORTED_VIDEO_FORMATS = ['video', 'mp4', 'mov', 'webm', 'ogg']
 SUPPORTED_FILE_FORMATS = SUPPORTED_VIDEO_FORMATS + ['pdf']
 
-# Number of seconds between actions that report the ongoing video play position.
-# Keep this constant in sync with videoPlayReportingInterval on the frontend!
-VIDEO_PLAY_REPORTING_INTERVAL = 10
+# Max number of seconds that enrichment workers can be kept waiting for a task
+MAX_ENRICHMENT_TASK_WAIT = 30
+
+# Max number of tasks that an enrichment worker can claim at once, so that one worker can't take the whole queue
+MAX_ENRICHMENT_TASKS_PER_CLAIM = 10
 
 
 # create database when starting the app
@@ -102,13 +110,13 @@ def cleanup_enrichment_errors():
     print('\nin cleanup_enrichment_errors')
     enrichments = WikichunkEnrichment.query.all()
     for enrichment in enrichments:
-        for chunk in enrichment.data['chunks']:
+        for chunk in enrichment.light_chunks():
             filtered_entities = [entity for entity in chunk['entities'] if entity['title'] not in WIKIFIER_BLACKLIST]
         if filtered_entities != chunk['entities']:
             print(chunk['entities'])
             print(filtered_entities)
             chunk['entities'] = filtered_entities
-            flag_modified(enrichment, 'data')
+            flag_modified(enrichment, 'chunks' if enrichment.chunks is not None else 'legacy_data')
             db_session.commit()
     print('done.\n')
 
@@ -118,6 +126,14 @@ wikipedia.set_lang("en")
 
 # Creating a repository for accessing database
 repository = Repository()
+oer_repository = OerRepository()
+
+# Remembers which OERs were found for popular search terms
+search_cache = create_search_cache(SEARCH_CACHE_BACKEND, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS)
+
+# Writes the actions that the frontend logs, either immediately or in batches
+action_writer = create_action_writer(ACTION_LOGGING_MODE, ACTION_WRITE_BEHIND_MAX_BATCH,
+                                     ACTION_WRITE_BEHIND_INTERVAL_SECONDS)
 
 
 # @app.route("/make_users_for_webinar/")
@@ -194,23 +210,21 @@ def api_session():
 def get_logged_in_user_profile_and_state():
     profile = current_user.user_profile if current_user.user_profile is not None else {
         'email': current_user.email}
-    logged_in_user = {'userProfile': profile, 'isContentFlowEnabled': is_contentflow_enabled(),
-                      'overviewTypeId': get_overview_type_setting()}
+    # The settings are kept up to date whenever the corresponding actions are logged
+    settings = UserSetting.query.get(current_user.get_id())
+    logged_in_user = {'userProfile': profile, 'isContentFlowEnabled': is_contentflow_enabled(settings),
+                      'overviewTypeId': get_overview_type_setting(settings)}
     return jsonify({'loggedInUser': logged_in_user})
 
 
-# Look at actions to determine whether ContentFlow is enabled or disabled
-def is_contentflow_enabled():
-    action = Action.query.filter(Action.user_login_id == current_user.get_id(),
-                                 Action.action_type_id.in_([7])).order_by(Action.id.desc()).first()
-    return True if action is None else action.params['enable']
+# Determine whether ContentFlow is enabled or disabled
+def is_contentflow_enabled(settings):
+    return True if settings is None or settings.content_flow_enabled is None else settings.content_flow_enabled
 
 
-# Look at actions to determine the OverviewType setting
-def get_overview_type_setting():
-    action = Action.query.filter(Action.user_login_id == current_user.get_id(),
-                                 Action.action_type_id.in_([10])).order_by(Action.id.desc()).first()
-    return 'thumbnail' if action is None else action.params['selectedMode']
+# Determine the OverviewType setting
+def get_overview_type_setting(settings):
+    return 'thumbnail' if settings is None or settings.overview_type is None else settings.overview_type
 
 
 # @user_registered.connect_via(app)
@@ -263,25 +277,42 @@ def api_search():
     return jsonify([oer.data_and_id() for oer in results])
 
 
+@app.route("/api/v1/search_cache_stats/", methods=['GET'])
+def api_search_cache_stats():
+    return jsonify(search_cache.stats())
+
+
 @app.route("/api/v1/oers/", methods=['POST'])
 def api_oers():
-    oers = [find_oer_by_id(oer_id) for oer_id in request.get_json()['ids']]
-    return jsonify(oers)
+    oer_ids = request.get_json()['ids']
+    oers = {oer.id: oer for oer in Oer.query.filter(Oer.id.in_(oer_ids))} if oer_ids else {}
+    payload = [oers[oer_id].data_and_id() if oer_id in oers else missing_oer_placeholder(oer_id)
+               for oer_id in oer_ids]
+    return conditional_json_response(payload)
+
+
+def conditional_json_response(payload):
+    # Werkzeug's make_conditional only handles GET requests, so we check If-None-Match ourselves.
+    # Clients that send the ETag of their previous response get a 304 without a body if nothing has changed.
+    response = jsonify(payload)
+    response.add_etag()
+    etag, _ = response.get_etag()
+    if request.if_none_match.contains(etag):
+        return '', 304, {'ETag': response.headers['ETag']}
+    return response
 
 
 @app.route("/api/v1/video_usages/", methods=['GET'])
 def api_video_usages():
-    actions = Action.query.filter(Action.user_login_id == current_user.get_id(),
-                                  Action.action_type_id.in_([4, 5, 6, 9])).order_by(Action.id).all()
-    positions_per_oer = defaultdict(list)
-    for action in actions:
-        oer_id = str(action.params['oerId'])
-        position = action.params['positionInSeconds']
-        positions_per_oer[oer_id].append(position)
-    ranges_per_oer = defaultdict(list)
-    for oer_id, positions in positions_per_oer.items():
-        ranges_per_oer[oer_id] = video_usage_ranges_from_positions(positions)
-    return jsonify(ranges_per_oer)
+    # The watched ranges are kept up to date whenever video play actions are logged
+    oer_ids = None
+    if request.args.get('oerIds'):
+        try:
+            oer_ids = [int(oer_id) for oer_id in request.args['oerIds'].split(',')]
+        except ValueError:
+            return jsonify({'error': 'oerIds must be a comma-separated list of integers'}), 400
+    ranges_per_oer = get_video_usages(current_user.get_id(), oer_ids)
+    return jsonify({str(oer_id): serialize_ranges(ranges) for oer_id, ranges in ranges_per_oer.items()})
 
 
 @app.route("/api/v1/course_optimization/", methods=['POST'])
@@ -324,20 +355,6 @@ def api_save_ui_logged_events_batch():
     return 'OK'
 
 
-def video_usage_ranges_from_positions(positions):
-    ranges = []
-    positions = sorted(positions)
-    for index, position in enumerate(positions):
-        if index > 0 and position >= ranges[-1]['start'] and position < ranges[-1]['start'] + ranges[-1][
-            'length'] + VIDEO_PLAY_REPORTING_INTERVAL:
-            # extend the last range
-            ranges[-1]['length'] = position - ranges[-1]['start'] + VIDEO_PLAY_REPORTING_INTERVAL
-        else:
-            # add a new range
-            ranges.append({'start': position, 'length': VIDEO_PLAY_REPORTING_INTERVAL})
-    return ranges
-
-
 @app.route("/api/v1/featured/", methods=['GET'])
 def api_featured():
     urls = ['http://hydro.ijs.si/v015/f9/7gh3dwpzrfpfvxnrl5fkaq4nedrqguh6.mp4',
@@ -370,37 +387,52 @@ def api_save_user_profile():
 
 @app.route("/api/v1/wikichunk_enrichments/", methods=['POST'])
 def api_wikichunk_enrichments():
-    enrichments = []
-    for oer_id in request.get_json()['ids']:
-        enrichment = find_enrichment_by_oer_id(oer_id)
-        if enrichment is not None:
-            enrichments.append(enrichment.data)
-        else:
-            oer = Oer.query.get(oer_id)
-            if oer is not None:
-                push_enrichment_task(oer.url, 1)
-    return jsonify(enrichments)
+    oer_ids = request.get_json()['ids']
+    enrichments = find_enrichments_by_oer_ids(oer_ids)
+    missing_ids = [oer_id for oer_id in oer_ids if oer_id not in enrichments]
+    if missing_ids:
+        push_enrichment_tasks([(oer.url, 1) for oer in Oer.query.filter(Oer.id.in_(missing_ids))])
+    # The enrichment may reference another OER with the same url, or none if that OER was deleted
+    return jsonify([dict(enrichments[oer_id].light_data(), oerId=oer_id)
+                    for oer_id in oer_ids if oer_id in enrichments])
 
 
 @app.route("/api/v1/most_urgent_unstarted_enrichment_task/", methods=['POST'])
 def most_urgent_unstarted_enrichment_task():
-    timeout = datetime.now() - timedelta(minutes=10)
-    task = WikichunkEnrichmentTask.query.filter(and_(WikichunkEnrichmentTask.error == None, or_(
-        WikichunkEnrichmentTask.started == None, WikichunkEnrichmentTask.started < timeout))).order_by(
-        WikichunkEnrichmentTask.priority.desc()).first()
-    if task is None:
+    # Workers that pass a limit get a list of up to that many tasks.
+    # Otherwise we return a single task, as expected by older workers.
+    limit = request.form.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_ENRICHMENT_TASKS_PER_CLAIM))
+    # Workers that pass wait=<seconds> are kept waiting until a task is available (long polling)
+    wait = min(request.form.get('wait', default=0, type=float), MAX_ENRICHMENT_TASK_WAIT)
+    tasks = wait_for_enrichment_tasks(limit or 1, wait)
+    if len(tasks) == 0:
         return jsonify({'info': 'No tasks available'})
-    url = task.url
-    print('Starting task with priority:', task.priority, 'url:', url)
-    task.started = datetime.now()
-    task.priority = 0
-    db_session.commit()
-    oer = Oer.query.filter_by(url=url).first()
-    if oer is None:
-        msg = 'Missing OER: ' + str(url)
-        print(msg)
-        return jsonify({'info': msg})
-    return jsonify({'data': oer.data})
+    urls = [task.url for task in tasks]
+    claimed_at = {task.url: task.started.isoformat() for task in tasks}
+    oers = {oer.url: oer for oer in Oer.query.filter(Oer.url.in_(urls)).all()}
+    for url in urls:
+        if url not in oers:
+            print('Missing OER: ' + str(url))
+    if limit is not None:
+        # Workers confirm each claim with start_enrichment_task when they get to the task
+        return jsonify({'tasks': [{'data': oers[url].data, 'claimedAt': claimed_at[url]}
+                                  for url in urls if url in oers]})
+    if urls[0] not in oers:
+        return jsonify({'info': 'Missing OER: ' + str(urls[0])})
+    return jsonify({'data': oers[urls[0]].data})
+
+
+@app.route("/api/v1/start_enrichment_task/", methods=['POST'])
+def start_enrichment_task():
+    url = request.form['url']
+    try:
+        claimed_at = datetime.fromisoformat(request.form['claimedAt'])
+    except ValueError:
+        return jsonify({'error': 'Invalid claimedAt'}), 400
+    # A task that has been claimed by another worker in the meantime is skipped
+    return jsonify({'start': start_claimed_enrichment_task(url, claimed_at)})
 
 
 @app.route("/api/v1/ingest_wikichunk_enrichment/", methods=['POST'])
@@ -436,6 +468,15 @@ def ingest_oer():
     return do_ingest_oer(material_id)
 
 
+@app.route("/api/v1/existing_material_ids/", methods=['POST'])
+def api_existing_material_ids():
+    """Tells which of the given X5GON material ids have been ingested already, using a single query.
+    Used by ingest_oer_loop.py to skip them."""
+    j = request.get_json(force=True)
+    oer_ids = oer_repository.get_oer_ids_by_material_ids(j['material_ids'])
+    return jsonify({'material_ids': sorted(oer_ids)})
+
+
 def do_ingest_oer(material_id):
     oer = find_oer_by_material_id(material_id)
     if oer is not None:
@@ -470,56 +511,61 @@ def api_entity_descriptions():
 
 
 def search_results_from_x5gon_api(text):
-    text = urllib.parse.quote(text)
+    text = urllib.parse.quote(normalize_search_text(text))
     if is_special_search_key_for_lab_study(text):
         return frozen_search_results_for_lab_study(text)
-    return search_results_from_x5gon_api_pages(text, 1, [])
+    oer_ids = search_cache.get_oer_ids(text, search_oer_ids_from_x5gon_api)
+    return find_oers_by_ids(oer_ids)
 
 
-# This function is called recursively
-# until the number of search results hits a certain minimum or stops increasing
-def search_results_from_x5gon_api_pages(text, page_number, oers):
-    # print('X5GON search page_number', page_number)
-    conn = http.client.HTTPSConnection("platform.x5gon.org")
-    conn.request(
-        'GET', '/api/v1/search/?url=https://platform.x5gon.org/materialUrl&type=all&text=' + text + '&page=' + str(
-            page_number))
-    response = conn.getresponse().read().decode("utf-8")
-    metadata = json.loads(response)['metadata']
-    materials = json.loads(response)['rec_materials']
-    materials = filter_x5gon_search_results(materials)
-    # materials = remove_duplicates_from_x5gon_search_results(materials)
-    for index, material in enumerate(materials):
-        url = material['url']
-        # Some urls that were longer than 255 caused errors.
-        # TODO: change the type of all url colums from String(255) to Text()
-        # Temporary fix: ignore search results with very long urls
-        if len(url) > 255:
-            continue
-        material = fetch_captions_from_x5gon_api(material)
-        oer = retrieve_oer_or_create_from_x5gon_material(material)
-        push_enrichment_task(url, int(1000 / (index + 1)) + 1)
-        oers.append(oer)
-    oers = oers[:MAX_SEARCH_RESULTS]
-    # exits the search if exceeds the last page returned from the api
-    if page_number > metadata['total_pages']:
-        return oers
-    if len(oers) >= MAX_SEARCH_RESULTS:
-        return oers
-    return search_results_from_x5gon_api_pages(text, page_number + 1, oers)
-
-
-def retrieve_oer_or_create_from_x5gon_material(material):
-    url = material['url']
-    oer = Oer.query.filter_by(url=url).first()
-    if oer is None:
-        oer = Oer(url, convert_x5_material_to_oer_data(material))
-        db_session.add(oer)
-        db_session.commit()
+def search_oer_ids_from_x5gon_api(text):
+    return [oer.id for oer in search_results_from_x5gon_api_pages(text)]
+
+
+def search_results_from_x5gon_api_pages(text):
+    materials = search_materials(text, MAX_SEARCH_RESULTS)
+    oers = materialize_oers_from_x5gon_materials(materials)
+    push_enrichment_tasks([(oer.url, int(1000 / (index + 1)) + 1) for index, oer in enumerate(oers)])
+    return oers
+
+
+def materialize_oers_from_x5gon_materials(materials):
+    """Finds or creates the OERs for a list of X5GON materials, using a single transaction.
+
+    Args:
+        materials (list(dict)): materials from the X5GON API
+
+    Returns:
+        (list(Oer)): one OER per material, in the same order
+
+    """
+    if not materials:
+        return []
+    urls = [material['url'] for material in materials]
+    # If there are several OERs with the same url, use the oldest one
+    oers = {oer.url: oer for oer in Oer.query.filter(Oer.url.in_(urls)).order_by(Oer.id.desc()).all()}
+    new_oers_data = {}
+    for material in materials:
+        if material['url'] not in oers and material['url'] not in new_oers_data:
+            new_oers_data[material['url']] = convert_x5_material_to_oer_data(material)
+    if new_oers_data:
+        rows = [{'url': url, 'data': data, 'material_id': material_id_from_oer_data(data)}
+                for url, data in new_oers_data.items()]
+        new_ids = [row.id for row in db_session.execute(Oer.__table__.insert().values(rows).returning(Oer.id))]
+        for oer in Oer.query.filter(Oer.id.in_(new_ids)).all():
+            oers[oer.url] = oer
+    for oer in oers.values():
+        normalize_oer_data(oer)
+    db_session.commit()
+    push_enrichment_tasks_if_needed([(url, 1) for url in oers])
+    return [oers[url] for url in urls]
+
+
+def normalize_oer_data(oer):
     # Fix a problem with videolectures lacking duration info
     if oer.data['mediatype'] in SUPPORTED_VIDEO_FORMATS and oer.data['duration'] == '' and (
             'durationInSeconds' not in oer.data):
-        oer = inject_duration(oer)
+        inject_duration(oer)
     # Fix provider dict replaced with a string as expected by Elm
     if isinstance(oer.data['provider'], dict):
         new_data = json.loads(json.dumps(oer.data))
@@ -529,8 +575,6 @@ def retrieve_oer_or_create_from_x5gon_material(material):
         new_data = json.loads(json.dumps(oer.data))
         new_data['provider'] = " - "
         oer.data = new_data
-    push_enrichment_task_if_needed(url, 1)
-    return oer
 
 
 def inject_duration(oer):
@@ -543,32 +587,9 @@ def inject_duration(oer):
     new_data['durationInSeconds'] = seconds
     new_data['duration'] = duration
     oer.data = new_data
-    db_session.commit()
     return oer
 
 
-def filter_x5gon_search_results(materials):
-    # (un)comment the lines below to enable/disable filters as desired
-
-    # include videos only
-    materials = [m for m in materials if is_video(m['url'])]
-
-    # exclude youtube videos
-    materials = [m for m in materials if 'youtu' not in m['url']]
-
-    # filter by file suffix
-    # materials = [m for m in materials if m['url'].endswith(
-    #     '.pdf') or is_video(m['url'])]
-
-    # crudely filter out materials from MIT OCW that are assignments or date back to the 90s or early 2000s
-    # materials = [m for m in materials if '/assignments/' not in m['url']
-    #              and '199' not in m['url'] and '200' not in m['url']]
-
-    # Exclude non-english materials because they tend to come out poorly after wikification. X5GON search doesn't have a language parameter at the time of writing.
-    # materials = [m for m in materials if m['language'] == 'en']
-    return materials
-
-
 # def remove_duplicates_from_x5gon_search_results(materials):
 #     enrichments = {}
 #     urls = [m['url'] for m in materials]
@@ -626,21 +647,6 @@ def convert_x5_material_to_oer_data(material):
     return data
 
 
-def fetch_captions_from_x5gon_api(material):
-    oer_translations_endpoint = "/oer_materials/{}/contents?extension=webvtt"
-    contents = requests.get(
-        "https://platform.x5gon.org/api/v1" + oer_translations_endpoint.format(material['material_id'])).json()
-
-    material['translations'] = {}
-    for content in contents['oer_contents']:
-        # api does not seem to filter webvtt yet so doing it manually
-        if content['extension'] != 'webvtt':
-            continue
-        material['translations'][content['language']] = content.get('value', '').get('value', '')
-
-    return material
-
-
 def save_definitions(data):
     definitions = set([])
     for chunk in data['chunks']:
@@ -676,29 +682,34 @@ def save_definitions(data):
         db_session.commit()
 
 
+def find_oers_by_ids(oer_ids):
+    # Load all OERs with a single query, preserving the order of the ids and skipping missing ones
+    oers = {oer.id: oer for oer in Oer.query.filter(Oer.id.in_(oer_ids)).all()} if oer_ids else {}
+    return [oers[oer_id] for oer_id in oer_ids if oer_id in oers]
+
+
 def find_oer_by_id(oer_id):
     oer = Oer.query.get(oer_id)
     if oer is not None:
         return oer.data_and_id()
     else:
-        # Return a blank OER. This should not happen normally
-        print('Missing OER with id', oer_id)
-        oer = {}
-        oer['id'] = oer_id
-        oer['date'] = ''
-        oer['description'] = '(Sorry, this resource is no longer accessible)'
-        oer['duration'] = ''
-        oer['images'] = []
-        oer['provider'] = ''
-        oer['title'] = '(not found)'
-        oer['url'] = ''
-        oer['mediatype'] = 'text'
-        return oer
-
-
-def is_video(url):
-    url = url.lower()
-    return url.endswith('.mp4') or url.endswith('.webm') or url.endswith('.ogg')
+        return missing_oer_placeholder(oer_id)
+
+
+def missing_oer_placeholder(oer_id):
+    # Return a blank OER. This should not happen normally
+    print('Missing OER with id', oer_id)
+    oer = {}
+    oer['id'] = oer_id
+    oer['date'] = ''
+    oer['description'] = '(Sorry, this resource is no longer accessible)'
+    oer['duration'] = ''
+    oer['images'] = []
+    oer['provider'] = ''
+    oer['title'] = '(not found)'
+    oer['url'] = ''
+    oer['mediatype'] = 'text'
+    return oer
 
 
 # THUMBNAILS FOR X5GON (experimental)
@@ -779,7 +790,8 @@ class ActionList(Resource):
                                            'with_oer_id_only': 'Fetch actions only with material id (Default: false)',
                                            'sort': 'Sort result set by timestamp (Default: desc)',
                                            'offset': 'Offset result set by the given number (Default: 0)',
-                                           'limit': 'Limit result set to a specific number of records (Default: None)'})
+                                           'limit': 'Limit result set to a specific number of records (Default: None)',
+                                           'cursor': 'Continue after the last page, using the value of its X-Next-Cursor header (Default: None)'})
     def get(self):
         '''Fetches multiple actions from database based on params'''
         if not current_user.is_authenticated:
@@ -794,45 +806,36 @@ class ActionList(Resource):
                 'true', 'false'), help='Bad choice')
             parser.add_argument('offset', default=0, type=int)
             parser.add_argument('limit', default=None, type=int)
+            parser.add_argument('cursor', default=None, type=str)
             args = parser.parse_args()
 
+            cursor = None
+            if args['cursor']:
+                cursor = parse_action_cursor(args['cursor'])
+                if cursor is None:
+                    return {'result': 'Invalid cursor'}, 400
+
             # Creating a actions repository for unique data fetch
             actions_repository = ActionsRepository()
             result_list = actions_repository.get_actions(current_user.get_id(), args['action_type_id'], args['sort'],
-                                                         args['offset'], args['limit'])
-
-            # Eliminating actions without a material id
-            to_be_removed = list()
-            if args['with_oer_id_only'] == "true":
-                for i in result_list:
-                    if not i.Action.params:
-                        to_be_removed.append(i)
-                    else:
-                        temp_list = i.Action.params
-                        if 'oer_id' not in temp_list:
-                            to_be_removed.append(i)
-
-            if to_be_removed:
-                for i in to_be_removed:
-                    result_list.remove(i)
+                                                         args['offset'], args['limit'],
+                                                         args['with_oer_id_only'] == 'true', cursor)
 
             # Converting result list to JSON friendly format
             serializable_list = list()
-            if (result_list):
-                for i in result_list:
-                    tempObject = i.Action.serialize
-                    tempObject['action_type'] = i.ActionType.description
-
-                    temp_list = i.Action.params
-                    if 'oer_id' in temp_list:
-                        temp_oer = repository.get_by_id(Oer, temp_list['oer_id'])
-                        if temp_oer.data:
-                            if 'title' in temp_oer.data:
-                                tempObject['params']['title'] = temp_oer.data['title']
-
-                    serializable_list.append(tempObject)
-
-            return serializable_list
+            for i in result_list:
+                tempObject = i.Action.serialize
+                tempObject['action_type'] = i.ActionType.description
+                if i.oer_title is not None:
+                    tempObject['params'] = {**tempObject['params'], 'title': i.oer_title}
+                serializable_list.append(tempObject)
+
+            # A full page suggests that there are more actions
+            headers = {}
+            if args['limit'] and len(result_list) == args['limit']:
+                last_action = result_list[-1].Action
+                headers['X-Next-Cursor'] = format_action_cursor(last_action.created_at, last_action.id)
+            return serializable_list, 200, headers
 
     @ns_action.doc('log_action', validate=True)
     @ns_action.expect(m_action)
@@ -842,25 +845,39 @@ class ActionList(Resource):
             return {'result': 'User not logged in'}, 401
 
         if api.payload['is_bundled']:
-            if len(api.payload['action_type_ids']) != len(api.payload['params_list']):
-                return {'result': 'One or more arguments were found missing.'}, 400
-            count = 0
-            for idx, val in enumerate(api.payload['action_type_ids']):
-                action = Action(val, json.loads(
-                    api.payload['params_list'][idx]), current_user.get_id())
-                repository.add(action)
-                count = count + 1
-            return {'result': 'Actions logged. No of Actions - {}'.format(count)}, 201
+            # Validate the whole bundle before writing it with a single insert
+            try:
+                rows = parse_actions(api.payload['action_type_ids'], api.payload['params_list'],
+                                     current_user.get_id())
+            except InvalidActionsError as err:
+                return {'result': str(err)}, 400
+            action_writer.write(rows)
+            return {'result': 'Actions logged. No of Actions - {}'.format(len(rows))}, 201
         else:
             if not api.payload['action_type_id']:
                 return {'result': 'Action type id is required'}, 400
             else:
-                action = Action(api.payload['action_type_id'], json.loads(
-                    api.payload['params']), current_user.get_id())
-                repository.add(action)
+                try:
+                    rows = parse_actions([api.payload['action_type_id']], [api.payload['params']],
+                                         current_user.get_id())
+                except InvalidActionsError as err:
+                    return {'result': str(err)}, 400
+                action_writer.write(rows)
                 return {'result': 'Action logged'}, 201
 
 
+def format_action_cursor(created_at, action_id):
+    return '{}_{}'.format(created_at.isoformat(), action_id)
+
+
+def parse_action_cursor(cursor):
+    try:
+        created_at, action_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(action_id)
+    except ValueError:
+        return None
+
+
 # Defining user resource for API access
 ns_user = api.namespace('api/v1/user', description='User')
 
@@ -1215,16 +1232,30 @@ def initiate_action_types_table():
 
 
 def find_enrichment_by_oer_id(oer_id):
-    # Querying the JSON field this way resulted in bizarre CPU load on my Mac.
-    # enrichment = WikichunkEnrichment.query.filter(
-    #     WikichunkEnrichment.data['oerId'].astext.cast(Integer) == oer_id).first()
-    # The following quick fix takes a small detour by loading the OER.
-    # NB a more performant solution would be to add an oer_id column
-    # to WikichunkEnrichment but is beyond the scope of this issue.
-    oer = Oer.query.get(oer_id)
-    if oer is None:
-        return None
-    return WikichunkEnrichment.query.filter_by(url=oer.url).first()
+    return find_enrichments_by_oer_ids([oer_id]).get(oer_id)
+
+
+def find_enrichments_by_oer_ids(oer_ids):
+    """Finds the enrichments of several OERs, using the indexed oer_id column.
+
+    Args:
+        oer_ids ([int]): ids of OERs
+
+    Returns:
+        {int: WikichunkEnrichment}: the enrichment for each OER id that has one
+    """
+    oer_ids = set(oer_ids)
+    if not oer_ids:
+        return {}
+    enrichments = {enrichment.oer_id: enrichment for enrichment in
+                   WikichunkEnrichment.query.filter(WikichunkEnrichment.oer_id.in_(oer_ids))}
+    # Several OERs can share a url and thereby an enrichment, which only references one of them
+    missing_ids = oer_ids - set(enrichments)
+    if missing_ids:
+        for oer_id, enrichment in db_session.query(Oer.id, WikichunkEnrichment).join(
+                WikichunkEnrichment, WikichunkEnrichment.url == Oer.url).filter(Oer.id.in_(missing_ids)):
+            enrichments.setdefault(oer_id, enrichment)
+    return enrichments
 
 
 # old solution - wouldn't scale well to millions of oers - see issue #290
@@ -1282,28 +1313,18 @@ def recommendations_from_lam_api(oer_id):
         print(type(response_json))
         print(response_json)
         return []
-    oers = []
-    for material in materials:
-        # print(material['material_id'], material['weight'], material['type'])
-        # stop once we have enough items
-        if len(oers) > 4:
-            break
-        # include only supported media formats
-        if material['type'] not in SUPPORTED_FILE_FORMATS:
-            continue
-        url = material['url']
-        # Some urls that were longer than 255 caused errors.
-        # TODO: change the type of all url colums from String(255) to Text()
-        # Temporary fix: ignore search results with very long urls
-        if len(url) > 255:
-            continue
-        oer = retrieve_oer_or_create_from_x5gon_material(material)
-        oers.append(oer)
-    return oers
+    # include only supported media formats
+    materials = [material for material in materials if material['type'] in SUPPORTED_FILE_FORMATS]
+    # Some urls that were longer than 255 caused errors.
+    # TODO: change the type of all url colums from String(255) to Text()
+    # Temporary fix: ignore search results with very long urls
+    materials = [material for material in materials if len(material['url']) <= 255]
+    # stop once we have enough items
+    return materialize_oers_from_x5gon_materials(materials[:5])
 
 
 def find_oer_by_material_id(material_id):
-    return Oer.query.filter(Oer.data['material_id'].astext == str(material_id)).order_by(Oer.id.desc()).first()
+    return oer_repository.find_by_material_id(material_id)
 
 
 if __name__ == '__main__':
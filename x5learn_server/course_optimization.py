@@ -1,53 +1,62 @@
 import requests
 import json
+from functools import lru_cache
 
 from x5learn_server.db.database import db_session
-from x5learn_server.models import Oer
+from x5learn_server.models import Oer, OerRepository
 
+# API base url
+API_URL = "http://wp3dev.x5gon.org"
 
-def convert_to_oer_ids(material_ids):
-    result = []
-    for material_id in material_ids:
-        oer = find_oer_by_material_id(material_id)
-        if oer is not None:
-            print('convert', material_id, '->', oer.id, '=', oer.data['material_id'])
-            result.append(oer.id)
-    return result
+# setup appropriate headers
+HEADERS = {
+    'accept': 'application/json',
+    'Content-Type': 'application/json',
+}
 
+# endpoint
+ENDPOINT = '/others/lamdsh/predictorder'
 
-def optimize_course(oer_ids):
-    # API base url
-    API_URL = "http://wp3dev.x5gon.org"
+PREDICT_ORDER_TIMEOUT = 30
 
-    # setup appropriate headers
-    HEADERS = {
-        'accept': 'application/json',
-        'Content-Type': 'application/json',
-    }
+# Users tend to optimize the same course several times, so we remember the orders of recent courses
+PREDICT_ORDER_CACHE_SIZE = 1000
 
-    # endpoint
-    ENDPOINT = '/others/lamdsh/predictorder'
+# Keep connections to the ordering service alive between requests
+session = requests.Session()
 
-    material_ids = convert_to_material_ids(oer_ids)
 
-    data = {'resource_ids': material_ids}
-    response = requests.post(API_URL + ENDPOINT,
-                         headers= HEADERS,
-                         data=json.dumps(data))
-    response_json = response.json()
+def convert_to_oer_ids(material_ids):
+    """Converts X5GON material ids to OER ids with a single query, keeping the order and skipping unknown ids."""
+    oer_ids = OerRepository().get_oer_ids_by_material_ids(material_ids)
+    return [oer_ids[int(material_id)] for material_id in material_ids if int(material_id) in oer_ids]
+
 
-    new_material_ids = response_json['output']
+def optimize_course(oer_ids):
+    material_ids = convert_to_material_ids(oer_ids)
+    new_material_ids = predict_order(tuple(material_ids))
     new_oer_ids = convert_to_oer_ids(new_material_ids)
     return new_oer_ids
 
 
+@lru_cache(maxsize=PREDICT_ORDER_CACHE_SIZE)
+def predict_order(material_ids):
+    data = {'resource_ids': list(material_ids)}
+    response = session.post(API_URL + ENDPOINT,
+                            headers=HEADERS,
+                            data=json.dumps(data),
+                            timeout=PREDICT_ORDER_TIMEOUT)
+    response_json = response.json()
+    return tuple(response_json['output'])
+
+
 def convert_to_material_ids(oer_ids):
-    result = []
-    for oer_id in oer_ids:
-        oer = Oer.query.get(oer_id)
-        if oer is not None:
-            result.append(int(oer.data['material_id']))
-    return result
+    """Converts OER ids to X5GON material ids with a single query, keeping the order and skipping unknown ids."""
+    if not oer_ids:
+        return []
+    material_ids = dict(db_session.query(Oer.id, Oer.material_id).filter(Oer.id.in_(oer_ids),
+                                                                         Oer.material_id.isnot(None)))
+    return [material_ids[oer_id] for oer_id in oer_ids if oer_id in material_ids]
 
 
 def get_material_id(oer_id):
@@ -58,4 +67,4 @@ def get_material_id(oer_id):
 
 
 def find_oer_by_material_id(material_id):
-    return Oer.query.filter(Oer.data['material_id'].astext == str(material_id)).order_by(Oer.id.desc()).first()
+    return OerRepository().find_by_material_id(material_id)
@@ -0,0 +1,108 @@
+from sqlalchemy.orm import undefer
+
+from x5learn_server._config import DB_ENGINE_URI
+from x5learn_server.db.database import get_or_create_db, init_db
+
+db_session = get_or_create_db(DB_ENGINE_URI)
+
+from x5learn_server.models import WikichunkEnrichment
+
+# init_db() creates missing tables but it doesn't change existing ones.
+# This script applies the schema changes that existing databases need, such as new columns and indexes.
+# Every statement is idempotent, so it is safe to run the script after each deployment:
+# python -m x5learn_server.db.migrations
+# Statements are either SQL strings or functions, for data conversions that are easier to express in Python.
+
+# Number of rows that data conversions load and commit at a time
+MIGRATION_BATCH_SIZE = 500
+
+
+def split_legacy_enrichment_data():
+    # Moves the payloads of enrichments that were saved as a single JSON blob into the separate columns
+    converted = 0
+    while True:
+        enrichments = WikichunkEnrichment.query.options(undefer(WikichunkEnrichment.legacy_data)) \
+            .filter(WikichunkEnrichment.chunks.is_(None), WikichunkEnrichment.legacy_data.isnot(None)) \
+            .order_by(WikichunkEnrichment.id).limit(MIGRATION_BATCH_SIZE).all()
+        if not enrichments:
+            break
+        for enrichment in enrichments:
+            enrichment.data = enrichment.legacy_data
+        db_session.commit()
+        db_session.expunge_all()
+        converted += len(enrichments)
+        print(converted, 'enrichments converted')
+
+MIGRATIONS = [
+    ('Index for claiming enrichment tasks', [
+        'CREATE INDEX IF NOT EXISTS ix_wikichunk_enrichment_task_claim '
+        'ON wikichunk_enrichment_task (error, started, priority)',
+    ]),
+    ('Separate columns for the parts of enrichments, with compressed chunk texts', [
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS oer_id INTEGER',
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS chunks JSONB',
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS mentions JSONB',
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS clusters JSONB',
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS errors BOOLEAN',
+        'ALTER TABLE wikichunk_enrichment ADD COLUMN IF NOT EXISTS chunk_texts BYTEA',
+        split_legacy_enrichment_data,
+    ]),
+    ('Indexed oer_id and url columns on enrichments', [
+        # Enrichments that were saved before oer_id was filled in are matched via their url, to the oldest OER
+        'UPDATE wikichunk_enrichment e SET oer_id = o.id '
+        'FROM (SELECT url, min(id) AS id FROM oer GROUP BY url) o '
+        'WHERE e.oer_id IS NULL AND o.url = e.url',
+        'UPDATE wikichunk_enrichment e SET oer_id = NULL '
+        'WHERE e.oer_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM oer o WHERE o.id = e.oer_id)',
+        '''DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'wikichunk_enrichment_oer_id_fkey') THEN
+                ALTER TABLE wikichunk_enrichment ADD CONSTRAINT wikichunk_enrichment_oer_id_fkey
+                    FOREIGN KEY (oer_id) REFERENCES oer (id) ON DELETE SET NULL;
+            END IF;
+        END $$''',
+        'CREATE INDEX IF NOT EXISTS ix_wikichunk_enrichment_oer_id ON wikichunk_enrichment (oer_id)',
+        'CREATE INDEX IF NOT EXISTS ix_wikichunk_enrichment_url ON wikichunk_enrichment (url)',
+    ]),
+    ('Indexed material_id column on OERs', [
+        'ALTER TABLE oer ADD COLUMN IF NOT EXISTS material_id INTEGER',
+        "UPDATE oer SET material_id = (data->>'material_id')::integer "
+        "WHERE material_id IS NULL AND data->>'material_id' ~ '^[0-9]{1,9}$'",
+        'CREATE INDEX IF NOT EXISTS ix_oer_material_id ON oer (material_id, id)',
+    ]),
+    ('Index for listing the actions of a user', [
+        'CREATE INDEX IF NOT EXISTS ix_action_user_login_id_created_at ON action (user_login_id, created_at, id)',
+    ]),
+    ('User settings derived from the latest setting actions', [
+        'CREATE INDEX IF NOT EXISTS ix_action_user_login_id_action_type_id '
+        'ON action (user_login_id, action_type_id, id)',
+        # Settings that were changed since the deployment are newer than the ones in the history, so they are kept
+        '''INSERT INTO user_setting (user_login_id, content_flow_enabled, overview_type)
+        SELECT * FROM (SELECT u.id,
+            (SELECT (a.params->>'enable') = 'true' FROM action a
+             WHERE a.user_login_id = u.id AND a.action_type_id = 7 ORDER BY a.id DESC LIMIT 1) AS content_flow_enabled,
+            (SELECT a.params->>'selectedMode' FROM action a
+             WHERE a.user_login_id = u.id AND a.action_type_id = 10 ORDER BY a.id DESC LIMIT 1) AS overview_type
+            FROM user_login u) s
+        WHERE s.content_flow_enabled IS NOT NULL OR s.overview_type IS NOT NULL
+        ON CONFLICT (user_login_id) DO UPDATE SET
+            content_flow_enabled = COALESCE(user_setting.content_flow_enabled, EXCLUDED.content_flow_enabled),
+            overview_type = COALESCE(user_setting.overview_type, EXCLUDED.overview_type)''',
+    ]),
+]
+
+
+def run_migrations():
+    init_db()
+    for description, statements in MIGRATIONS:
+        print(description, '...')
+        for statement in statements:
+            if callable(statement):
+                statement()
+            else:
+                db_session.execute(statement)
+        db_session.commit()
+    print('Done.')
+
+
+if __name__ == '__main__':
+    run_migrations()
@@ -1,37 +1,132 @@
 # _ = get_or_create_db(DB_ENGINE_URI)
-import sqlalchemy
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from sqlalchemy.dialects.postgresql import insert
 
 from x5learn_server.db.database import db_session
 from x5learn_server.models import Oer, WikichunkEnrichment, WikichunkEnrichmentTask
+from x5learn_server.task_notifications import get_task_notifier
 
 CURRENT_ENRICHMENT_VERSION = 1
 
+# Tasks that were started longer ago than this are considered abandoned and can be claimed again
+ENRICHMENT_TASK_TIMEOUT = timedelta(minutes=10)
+
 
 def push_enrichment_task_if_needed(url, urgency):
-    # check if OER is already listed for enrichment
-    enrichment = WikichunkEnrichment.query.filter_by(url=url).first()
+    push_enrichment_tasks_if_needed([(url, urgency)])
+
+
+def push_enrichment_tasks_if_needed(url_urgency_pairs):
+    # check which OERs have an up-to-date enrichment already, using a single query
+    urls = [url for url, urgency in url_urgency_pairs]
+    if not urls:
+        return
+    enriched_urls = set(url for (url,) in db_session.query(WikichunkEnrichment.url).filter(
+        WikichunkEnrichment.url.in_(urls), WikichunkEnrichment.version == CURRENT_ENRICHMENT_VERSION))
 
     # if the enrichment is not present or outdated: push enrichment task
-    if (enrichment is None) or (enrichment.version != CURRENT_ENRICHMENT_VERSION):
-        push_enrichment_task(url, urgency)
+    push_enrichment_tasks([(url, urgency) for url, urgency in url_urgency_pairs if url not in enriched_urls])
 
 
 def push_enrichment_task(url, priority):
-    # print('push_enrichment_task')
-    try:
-        # check if the url is currently put in the task queue
-        task = WikichunkEnrichmentTask.query.filter_by(url=url).first()
-        # if not a task, create task in the task queue
-        if task is None:
-            task = WikichunkEnrichmentTask(url, priority)
-            db_session.add(task)
-        else:
-            # else increase priority
-            task.priority += priority
-        db_session.commit()
-    except sqlalchemy.orm.exc.StaleDataError:
-        print(
-            'sqlalchemy.orm.exc.StaleDataError caught and ignored.')  # This error came up occasionally. I'm not 100% sure about what it entails but it didn't seem to affect the user experience so I'm suppressing it for now to prevent a pointless alert on the frontend. Grateful for any helpful tips. More information on this error: https://docs.sqlalchemy.org/en/13/orm/exceptions.html#sqlalchemy.orm.exc.StaleDataError
+    push_enrichment_tasks([(url, priority)])
+
+
+def push_enrichment_tasks(url_priority_pairs):
+    """creates enrichment tasks, or increases their priority if they are already in the queue.
+
+    All tasks are upserted with a single statement, so concurrent requests don't lose
+    any priority increments.
+
+    Args:
+        url_priority_pairs (list((str, int))): urls of the OERs to enrich and the priority to add for each
+
+    """
+    priorities = defaultdict(int)
+    for url, priority in url_priority_pairs:
+        priorities[url] += priority
+    if not priorities:
+        return
+    table = WikichunkEnrichmentTask.__table__
+    # sorting the rows makes concurrent upserts lock them in the same order, which avoids deadlocks
+    statement = insert(table).values([{'url': url, 'priority': priorities[url]} for url in sorted(priorities)])
+    statement = statement.on_conflict_do_update(index_elements=[table.c.url],
+                                                set_={'priority': table.c.priority + statement.excluded.priority})
+    db_session.execute(statement)
+    db_session.commit()
+    # wake up workers that are waiting for tasks
+    get_task_notifier().publish()
+
+
+def claim_enrichment_tasks(limit):
+    """marks the most urgent unstarted tasks as started and returns them.
+
+    SKIP LOCKED ensures that workers polling at the same time never claim the same task.
+
+    Args:
+        limit (int): max number of tasks to claim
+
+    Returns:
+        (list(WikichunkEnrichmentTask)): claimed tasks, most urgent first
+
+    """
+    timeout = datetime.now() - ENRICHMENT_TASK_TIMEOUT
+    tasks = WikichunkEnrichmentTask.query.filter(and_(WikichunkEnrichmentTask.error == None, or_(
+        WikichunkEnrichmentTask.started == None, WikichunkEnrichmentTask.started < timeout))).order_by(
+        WikichunkEnrichmentTask.priority.desc()).limit(limit).with_for_update(skip_locked=True).all()
+    for task in tasks:
+        print('Starting task with priority:', task.priority, 'url:', task.url)
+        task.started = datetime.now()
+        task.priority = 0
+    db_session.commit()
+    return tasks
+
+
+def start_claimed_enrichment_task(url, claimed_at):
+    """renews the claim of a task when the worker actually starts it, if no other worker has claimed it since.
+
+    Tasks that are claimed in batches wait in the worker until their turn comes,
+    so without renewing, the last tasks of a batch could time out and be claimed again.
+
+    Args:
+        url (str): url of the claimed task
+        claimed_at (datetime): started time that the task got when it was claimed
+
+    Returns:
+        (bool): whether the worker should go ahead with the task
+
+    """
+    table = WikichunkEnrichmentTask.__table__
+    result = db_session.execute(table.update().where(table.c.url == url).where(table.c.started == claimed_at)
+                                .values(started=datetime.now()))
+    db_session.commit()
+    return result.rowcount > 0
+
+
+def wait_for_enrichment_tasks(limit, timeout):
+    """claims up to limit tasks, waiting for new tasks to be pushed if none are available.
+
+    Args:
+        limit (int): max number of tasks to claim
+        timeout (float): max number of seconds to wait
+
+    Returns:
+        (list(WikichunkEnrichmentTask)): claimed tasks, possibly empty if the timeout expired
+
+    """
+    deadline = time.time() + timeout
+    while True:
+        generation = get_task_notifier().generation
+        tasks = claim_enrichment_tasks(limit)
+        remaining = deadline - time.time()
+        if tasks or remaining <= 0:
+            return tasks
+        get_task_notifier().wait(generation, remaining)
 
 
 def save_enrichment(url, data):
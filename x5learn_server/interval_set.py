@@ -0,0 +1,97 @@
+from bisect import bisect_left, bisect_right
+
+
+class IntervalSet:
+    """
+    Set of disjoint half-open intervals [start, end), kept sorted in two parallel lists of starts and ends.
+    Adding an interval finds the intervals that it touches with binary search and replaces them with their union.
+    Many intervals at once are sorted and merged in a single pass instead.
+
+    Intervals that are less than min_gap apart are joined, e.g. to treat short gaps between reported
+    video play positions as watched. Overlapping and adjacent intervals are always joined.
+
+    Doesn't depend on the database, so it can be used by the app as well as by analytics scripts.
+    """
+
+    def __init__(self, intervals=(), min_gap=0):
+        self.min_gap = min_gap
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            check_interval(start, end)
+            if self._starts and self._joins(self._ends[-1], start):
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    @classmethod
+    def from_positions(cls, positions, length, min_gap=0):
+        """builds the set of intervals [position, position + length), which is faster than passing them as pairs."""
+        interval_set = cls(min_gap=min_gap)
+        starts, ends = interval_set._starts, interval_set._ends
+        for position in sorted(positions):
+            if starts and interval_set._joins(ends[-1], position):
+                ends[-1] = position + length
+            else:
+                starts.append(position)
+                ends.append(position + length)
+        return interval_set
+
+    def _joins(self, end, next_start):
+        return next_start <= end or next_start - end < self.min_gap
+
+    def add(self, start, end):
+        check_interval(start, end)
+        # first interval that ends too close to the new start, and first one that starts far enough after the new end
+        first = min(bisect_left(self._ends, start), bisect_right(self._ends, start - self.min_gap))
+        last = max(bisect_right(self._starts, end), bisect_left(self._starts, end + self.min_gap))
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+
+    def union(self, other):
+        return IntervalSet(list(self) + list(other), min_gap=max(self.min_gap, other.min_gap))
+
+    def total_length(self):
+        return sum(end - start for start, end in self)
+
+    def coverage_percentage(self, start, end):
+        """percentage of [start, end) that the intervals cover, e.g. how much of a video has been watched."""
+        if end <= start:
+            return 0.0
+        first = bisect_right(self._ends, start)
+        last = bisect_left(self._starts, end)
+        covered = sum(min(end, self._ends[i]) - max(start, self._starts[i]) for i in range(first, last))
+        return 100.0 * covered / (end - start)
+
+    def serialize(self):
+        """compact form for storage: a flat list of alternating starts and ends."""
+        return [value for interval in self for value in interval]
+
+    @classmethod
+    def deserialize(cls, values, min_gap=0):
+        interval_set = cls(min_gap=min_gap)
+        # the intervals were stored sorted and disjoint, so they can be taken over as they are
+        interval_set._starts = list(values[0::2])
+        interval_set._ends = list(values[1::2])
+        return interval_set
+
+    def __iter__(self):
+        return zip(self._starts, self._ends)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and list(self) == list(other)
+
+    def __repr__(self):
+        return 'IntervalSet({}, min_gap={})'.format(list(self), self.min_gap)
+
+
+def check_interval(start, end):
+    if end < start:
+        raise ValueError('Interval ends before it starts: [{}, {})'.format(start, end))
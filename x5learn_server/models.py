@@ -1,11 +1,13 @@
 from x5learn_server.db.database import Base, get_or_create_db
 from x5learn_server._config import DB_ENGINE_URI
 from flask_security import UserMixin, RoleMixin
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, deferred
 from sqlalchemy import Boolean, DateTime, Column, Integer, \
-    Text, String, ForeignKey, BigInteger, Float
-from sqlalchemy.dialects.postgresql import JSON
+    Text, String, ForeignKey, BigInteger, Float, Index, LargeBinary, case, cast, tuple_
+from sqlalchemy.dialects.postgresql import JSON, JSONB
 import datetime
+import json
+import zlib
 
 
 class RolesUsers(Base):
@@ -52,58 +54,149 @@ class User(Base):
     user_login_id = Column(Integer, ForeignKey('user_login.id'))
 
 
+class UserSetting(Base):
+    """
+    Latest settings of a user, derived from the actions that change them (see x5learn_server/action_logging.py).
+    Saves scanning the user's action history on every session request. NULL means the user kept the default.
+    """
+    __tablename__ = 'user_setting'
+    __table_args__ = {'extend_existing': True}
+    user_login_id = Column(Integer, ForeignKey('user_login.id'), primary_key=True)
+    content_flow_enabled = Column(Boolean())
+    overview_type = Column(String(255))
+
+
+class VideoUsage(Base):
+    """
+    Parts of a video that a user has watched in seconds, as a serialized IntervalSet (x5learn_server/interval_set.py).
+    Maintained from the video play actions as they are logged (see x5learn_server/video_usage.py).
+    """
+    __tablename__ = 'video_usage'
+    __table_args__ = {'extend_existing': True}
+    user_login_id = Column(Integer, ForeignKey('user_login.id'), primary_key=True)
+    oer_id = Column(Integer, primary_key=True)
+    ranges = Column(JSONB, nullable=False)
+
+    def __init__(self, user_login_id, oer_id, ranges):
+        self.user_login_id = user_login_id
+        self.oer_id = oer_id
+        self.ranges = ranges
+
+
 class Oer(Base):
     __tablename__ = 'oer'
-    __table_args__ = {'extend_existing': True}
+    # (material_id, id) lets the newest OER for a material_id be found without touching the table
+    __table_args__ = (Index('ix_oer_material_id', 'material_id', 'id'), {'extend_existing': True})
     id = Column(Integer(), primary_key=True)
     url = Column(Text(), nullable=False)
     data = Column(JSON())
+    material_id = Column(Integer())  # copy of data['material_id'] for fast lookups
 
     def __init__(self, url, data):
         self.url = url
         self.data = data
+        self.material_id = material_id_from_oer_data(data)
 
     def data_and_id(self):
+        # Works on a copy, so that serializing an OER never modifies the record.
+        result = {**self.data}
         # Ensure that image and date fields have the correct types.
         # This is just a lazy patch for pdfs that were poorly imported from csv.
         # TODO remove the if statements below after re-importing the pdfs.
-        if 'durationInSeconds' not in self.data:
-            self.data['durationInSeconds']=0.001 # tiny default value causes frontend to report the real duration
-        if self.data['images']=='[]':
-            self.data['images']=[]
-        if not isinstance(self.data['date'], str):
-            self.data['date'] = str(self.data['date'])
-        result = {**self.data}
+        if 'durationInSeconds' not in result:
+            result['durationInSeconds']=0.001 # tiny default value causes frontend to report the real duration
+        if result['images']=='[]':
+            result['images']=[]
+        if not isinstance(result['date'], str):
+            result['date'] = str(result['date'])
         result['id'] = self.id
         return result
 
 
+def material_id_from_oer_data(data):
+    # X5GON material ids are sometimes stored as strings
+    try:
+        return int(data['material_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 class WikichunkEnrichment(Base):
+    """
+    Enrichment of an OER, as produced by the enrichment worker.
+
+    The payload is split into columns, so that the big chunk texts don't have to be loaded with the rest.
+    The chunk texts are stored as compressed JSON and only loaded when accessed.
+    Rows that were saved before this split keep their payload in legacy_data until
+    the migration in x5learn_server/db/migrations.py has converted them.
+    """
     __tablename__ = 'wikichunk_enrichment'
     __table_args__ = {'extend_existing': True}
     id = Column(Integer(), primary_key=True)
-    url = Column(String(255), nullable=False)
-    data = Column(JSON)
+    url = Column(String(255), nullable=False, index=True)
+    legacy_data = deferred(Column('data', JSON))
     version = Column(Integer())
+    oer_id = Column(Integer(), ForeignKey('oer.id', ondelete='SET NULL'), index=True)
+    chunks = Column(JSONB)  # start, length and entities of each chunk, without the text
+    mentions = Column(JSONB)
+    clusters = Column(JSONB)
+    errors = Column(Boolean())
+    chunk_texts = deferred(Column(LargeBinary))
 
     def __init__(self, url, data, version):
         self.url = url
         self.data = data
         self.version = version
 
+    @property
+    def data(self):
+        """the full payload, including the chunk texts"""
+        if self.chunks is None:
+            return self.legacy_data
+        data = self.light_data()
+        for chunk, text in zip(data['chunks'], decompress_json(self.chunk_texts)):
+            chunk['text'] = text
+        return data
+
+    @data.setter
+    def data(self, data):
+        self.oer_id = data.get('oerId')
+        self.chunks = [{'start': chunk['start'], 'length': chunk['length'], 'entities': chunk['entities']}
+                       for chunk in data['chunks']]
+        self.mentions = data['mentions']
+        self.clusters = data['clusters']
+        self.errors = data['errors']
+        self.chunk_texts = compress_json([chunk['text'] for chunk in data['chunks']])
+        self.legacy_data = None
+
+    def light_data(self):
+        """the payload without the chunk texts, which is all that the frontend needs"""
+        if self.chunks is None:
+            data = dict(self.legacy_data)
+            data['chunks'] = [dict(chunk, text='') for chunk in data['chunks']]
+            return data
+        return {'chunks': [dict(chunk, text='') for chunk in self.chunks],
+                'mentions': self.mentions,
+                'clusters': self.clusters,
+                'errors': self.errors,
+                'oerId': self.oer_id}
+
+    def light_chunks(self):
+        return self.chunks if self.chunks is not None else self.legacy_data['chunks']
+
     def get_entity_titles(self):
         titles = []
-        for chunk in self.data['chunks']:
+        for chunk in self.light_chunks():
             for entity in chunk['entities']:
                 titles.append(entity['title'])
         return titles
 
     def entities_to_string(self):
-        return ','.join([','.join([e['title'] for e in chunk['entities']]) for chunk in self.data['chunks']])
+        return ','.join([','.join([e['title'] for e in chunk['entities']]) for chunk in self.light_chunks()])
 
     def all_entity_titles_as_lowercase_strings(self):
         result = []
-        for chunk in self.data['chunks']:
+        for chunk in self.light_chunks():
             result += [ e['title'].lower() for e in chunk['entities'] ]
         return result
 
@@ -111,7 +204,8 @@ class WikichunkEnrichment(Base):
         return ' '.join([ chunk['text'] for chunk in self.data['chunks'] ])
 
     def main_topics(self):
-        return [y for z in self.data['clusters'] for y in z] # concat lists
+        clusters = self.clusters if self.chunks is not None else self.legacy_data['clusters']
+        return [y for z in clusters for y in z] # concat lists
 
     def get_topic_overlap(self, topics):
         overlap = 0
@@ -121,9 +215,18 @@ class WikichunkEnrichment(Base):
         return overlap
 
 
+def compress_json(value):
+    return zlib.compress(json.dumps(value).encode('utf-8'))
+
+
+def decompress_json(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
 class WikichunkEnrichmentTask(Base):
     __tablename__ = 'wikichunk_enrichment_task'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (Index('ix_wikichunk_enrichment_task_claim', 'error', 'started', 'priority'),
+                      {'extend_existing': True})
     id = Column(Integer(), primary_key=True)
     url = Column(String(255), unique=True, nullable=False)
     priority = Column(Integer())
@@ -135,6 +238,21 @@ class WikichunkEnrichmentTask(Base):
         self.priority = priority
 
 
+class SearchCacheEntry(Base):
+    __tablename__ = 'search_cache_entry'
+    __table_args__ = {'extend_existing': True}
+    search_text = Column(Text(), primary_key=True)
+    oer_ids = Column(JSON())
+    stored_at = Column(Float())
+    last_used_at = Column(Float())
+
+    def __init__(self, search_text, oer_ids, stored_at):
+        self.search_text = search_text
+        self.oer_ids = oer_ids
+        self.stored_at = stored_at
+        self.last_used_at = stored_at
+
+
 class EntityDefinition(Base):
     __tablename__ = 'entity_definition'
     __table_args__ = {'extend_existing': True}
@@ -195,7 +313,10 @@ class ActionType(Base):
 
 class Action(Base):
     __tablename__ = 'action'
-    __table_args__ = {'extend_existing': True}
+    # for listing the actions of a user page by page, and for finding the latest action of a type
+    __table_args__ = (Index('ix_action_user_login_id_created_at', 'user_login_id', 'created_at', 'id'),
+                      Index('ix_action_user_login_id_action_type_id', 'user_login_id', 'action_type_id', 'id'),
+                      {'extend_existing': True})
     id = Column(Integer(), primary_key=True)
     action_type_id = Column(Integer, ForeignKey('action_type.id'))
     params = Column(JSON)
@@ -411,8 +532,9 @@ class Repository:
 
 class ActionsRepository(Repository):
 
-    def get_actions(self, user_login_id, action_type_id=None, sort="desc", offset=None, limit=None):
-        """gets multiple actions filtered by user logged in.
+    def get_actions(self, user_login_id, action_type_id=None, sort="desc", offset=None, limit=None,
+                    with_oer_id_only=False, cursor=None):
+        """gets multiple actions filtered by user logged in, together with their action types and OER titles in a single query.
 
         Args:
             user_login_id (int): user login id to auth records belonging to the user
@@ -420,14 +542,21 @@ class ActionsRepository(Repository):
             sort (str): sort by 'asc' or 'desc'
             offset (int): Number to offset result set with (Default: 0)
             limit (int): Number to limit records of result set (Default: None)
+            with_oer_id_only (bool): only include actions whose params contain an oer_id (Default: False)
+            cursor (tuple(datetime, int)): only include actions after this (created_at, id) in the sort order (Default: None)
 
         Returns:
-            (list(object)): list of objects of type actions
+            (list(object)): list of rows with the fields Action, ActionType and oer_title
 
         """
 
+        # Ids that aren't plain numbers would make the cast fail, so they get no title
+        oer_id = Action.params['oer_id'].astext
+        oer_id = case([(oer_id.op('~')('^[0-9]{1,9}$'), cast(oer_id, Integer))], else_=None)
+
         query_object = self._db_session.query(
-            Action, ActionType).join(ActionType)
+            Action, ActionType, Oer.data['title'].astext.label('oer_title')).join(ActionType) \
+            .outerjoin(Oer, Oer.id == oer_id)
 
         if (action_type_id):
             query_object = query_object.filter(
@@ -436,10 +565,18 @@ class ActionsRepository(Repository):
         query_object = query_object.filter(
             Action.user_login_id == user_login_id)
 
+        if (with_oer_id_only):
+            query_object = query_object.filter(
+                cast(Action.params, JSONB).has_key('oer_id'))
+
         if (sort == 'desc'):
-            query_object = query_object.order_by(Action.created_at.desc())
+            if (cursor):
+                query_object = query_object.filter(tuple_(Action.created_at, Action.id) < tuple_(*cursor))
+            query_object = query_object.order_by(Action.created_at.desc(), Action.id.desc())
         else:
-            query_object = query_object.order_by(Action.created_at.asc())
+            if (cursor):
+                query_object = query_object.filter(tuple_(Action.created_at, Action.id) > tuple_(*cursor))
+            query_object = query_object.order_by(Action.created_at.asc(), Action.id.asc())
 
         if (offset):
             query_object = query_object.offset(offset)
@@ -466,6 +603,10 @@ class UserRepository(Repository):
 
         self._db_session.query(Action).filter_by(
             user_login_id=user_login_id).delete()
+        self._db_session.query(UserSetting).filter_by(
+            user_login_id=user_login_id).delete()
+        self._db_session.query(VideoUsage).filter_by(
+            user_login_id=user_login_id).delete()
         self._db_session.query(User).filter_by(
             user_login_id=user_login_id).delete()
 
@@ -474,6 +615,41 @@ class UserRepository(Repository):
         return True
 
 
+class OerRepository(Repository):
+
+    def find_by_material_id(self, material_id):
+        """fetches the newest OER with the given X5GON material id.
+
+        Args:
+            material_id (int): X5GON material id (Required)
+
+        Returns:
+            (object): OER or None
+
+        """
+
+        return self._db_session.query(Oer).filter(Oer.material_id == int(material_id)) \
+            .order_by(Oer.id.desc()).first()
+
+    def get_oer_ids_by_material_ids(self, material_ids):
+        """maps X5GON material ids to OER ids in a single query. If several OERs have the same material id, the newest one is used.
+
+        Args:
+            material_ids (list(int)): X5GON material ids (Required)
+
+        Returns:
+            (dict) : OER id for each material id that has an OER
+
+        """
+
+        material_ids = set(int(material_id) for material_id in material_ids)
+        if not material_ids:
+            return {}
+        rows = self._db_session.query(Oer.material_id, Oer.id).filter(Oer.material_id.in_(material_ids)) \
+            .distinct(Oer.material_id).order_by(Oer.material_id, Oer.id.desc()).all()
+        return {material_id: oer_id for material_id, oer_id in rows}
+
+
 class DefinitionsRepository(Repository):
 
     def get_definitions_list(self, titles):
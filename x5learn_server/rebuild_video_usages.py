@@ -0,0 +1,28 @@
+import argparse
+
+from x5learn_server._config import DB_ENGINE_URI
+from x5learn_server.db.database import get_or_create_db, init_db
+db_session = get_or_create_db(DB_ENGINE_URI)
+from x5learn_server.video_usage import rebuild_video_usages
+
+
+# The watched parts of videos are updated whenever video play actions are logged.
+# This script recomputes them from the complete action history, which is needed
+# once to backfill the video_usage table, and whenever the way that ranges are
+# computed changes (e.g. VIDEO_PLAY_REPORTING_INTERVAL).
+# python -m x5learn_server.rebuild_video_usages [--user-login-ids 1 2 3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the watched video ranges from the logged actions')
+    parser.add_argument('--user-login-ids', type=int, nargs='+',
+                        help='only rebuild the ranges of these users (default: all users)')
+    args = parser.parse_args()
+    init_db()
+    rebuilt = rebuild_video_usages(args.user_login_ids)
+    db_session.commit()
+    print(rebuilt, 'video usages rebuilt')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.dialects.postgresql import insert
+
+from x5learn_server.db.database import db_session
+from x5learn_server.models import SearchCacheEntry
+
+# Avoid a database write on every cache hit. last_used_at is only refreshed if it is older than this.
+LAST_USED_RESOLUTION_SECONDS = 60
+
+
+def normalize_search_text(text):
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+
+class SearchCache:
+    """
+    caches the OER ids resulting from a search, keyed on the normalized search text.
+    Expired entries are returned immediately while a background thread refreshes them.
+    """
+
+    def __init__(self, backend, ttl_seconds):
+        self._backend = backend
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get_oer_ids(self, text, search):
+        """returns the cached oer ids for the search text, calling search(text) on a miss.
+
+        Args:
+            text (str): search text
+            search (function): takes the search text and returns a list of oer ids
+
+        Returns:
+            (list(int)): oer ids in the order of the search results
+
+        """
+        key = normalize_search_text(text)
+        entry = self._backend.get(key)
+        if entry is None:
+            self._count('misses')
+            oer_ids = search(text)
+            try:
+                self._backend.set(key, oer_ids, time.time())
+            except Exception as err:
+                # the search itself succeeded, so its results are still returned
+                db_session.rollback()
+                print('Search cache write failed for', key, err)
+            return oer_ids
+        oer_ids, stored_at = entry
+        if time.time() - stored_at > self._ttl_seconds:
+            self._count('stale_hits')
+            self._refresh_in_background(key, text, search)
+        else:
+            self._count('hits')
+        return oer_ids
+
+    def stats(self):
+        """the counters are kept by each process, even if the entries are shared via the database"""
+        with self._lock:
+            counters = {'pid': os.getpid(), 'hits': self.hits, 'staleHits': self.stale_hits, 'misses': self.misses}
+        return {'backend': self._backend.name, 'entries': self._backend.size(), 'thisProcess': counters}
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _refresh_in_background(self, key, text, search):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, text, search), daemon=True).start()
+
+    def _refresh(self, key, text, search):
+        try:
+            self._backend.set(key, search(text), time.time())
+        except Exception as err:
+            print('Search cache refresh failed for', key, err)
+        finally:
+            # the search uses the database regardless of the backend, and this thread's session must not leak
+            db_session.remove()
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+class InProcessSearchCacheBackend:
+    """
+    LRU cache that lives inside the current process
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, oer_ids, stored_at):
+        with self._lock:
+            self._entries[key] = (oer_ids, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+
+class DatabaseSearchCacheBackend:
+    """
+    LRU cache in the search_cache_entry table, shared between all worker processes
+    """
+    name = 'database'
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+
+    def get(self, key):
+        entry = SearchCacheEntry.query.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry.last_used_at > LAST_USED_RESOLUTION_SECONDS:
+            entry.last_used_at = now
+            db_session.commit()
+        return entry.oer_ids, entry.stored_at
+
+    def set(self, key, oer_ids, stored_at):
+        # an upsert, because other workers may store the same search text at the same time
+        values = {'oer_ids': oer_ids, 'stored_at': stored_at, 'last_used_at': stored_at}
+        statement = insert(SearchCacheEntry.__table__).values(search_text=key, **values)
+        db_session.execute(statement.on_conflict_do_update(index_elements=['search_text'], set_=values))
+        evicted_keys = [k for (k,) in db_session.query(SearchCacheEntry.search_text).order_by(
+            SearchCacheEntry.last_used_at.desc()).offset(self._max_entries).all()]
+        if evicted_keys:
+            SearchCacheEntry.query.filter(SearchCacheEntry.search_text.in_(evicted_keys)).delete(
+                synchronize_session=False)
+        db_session.commit()
+
+    def size(self):
+        return SearchCacheEntry.query.count()
+
+
+def create_search_cache(backend_name, max_entries, ttl_seconds):
+    if backend_name == DatabaseSearchCacheBackend.name:
+        backend = DatabaseSearchCacheBackend(max_entries)
+    else:
+        backend = InProcessSearchCacheBackend(max_entries)
+    return SearchCache(backend, ttl_seconds)
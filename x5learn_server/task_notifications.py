@@ -0,0 +1,106 @@
+import select
+import threading
+from time import sleep
+
+from x5learn_server.db import database
+
+# Lets enrichment workers wait for new tasks (long polling) instead of polling the database in a loop.
+# Request threads wait on a condition that is signalled whenever tasks are pushed.
+# With PostgreSQL, tasks pushed by other processes are picked up via LISTEN/NOTIFY.
+
+CHANNEL = 'x5learn_enrichment_tasks'
+
+
+class TaskNotifier:
+    """
+    in-process broker for "new enrichment tasks available" signals
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.generation = 0
+
+    def publish(self):
+        """signals that tasks have been pushed. Call this after committing the tasks."""
+        self.notify_waiters()
+
+    def notify_waiters(self):
+        with self._condition:
+            self.generation += 1
+            self._condition.notify_all()
+
+    def wait(self, generation, timeout):
+        """blocks until a signal newer than the given generation arrives or the timeout expires.
+
+        Args:
+            generation (int): value of self.generation before the caller last looked for tasks
+            timeout (float): max number of seconds to wait
+
+        Returns:
+            (bool): True if a signal arrived
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.generation != generation, timeout)
+
+
+class PostgresTaskNotifier(TaskNotifier):
+    """
+    shares the signals between processes using PostgreSQL LISTEN/NOTIFY
+    """
+
+    def __init__(self, engine):
+        super().__init__()
+        self._engine = engine
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self):
+        database.db_session.execute("SELECT pg_notify('{}', '')".format(CHANNEL))
+        database.db_session.commit()
+
+    def start_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            connection = None
+            try:
+                # use a dedicated connection that never goes back to the pool
+                connection = self._engine.raw_connection()
+                connection.detach()
+                connection.connection.autocommit = True
+                connection.cursor().execute('LISTEN {}'.format(CHANNEL))
+                # Signals sent before LISTEN took effect (at startup or while reconnecting) are lost,
+                # so wake up all waiters to make them look for tasks again
+                self.notify_waiters()
+                while True:
+                    if select.select([connection.connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.connection.poll()
+                    if connection.connection.notifies:
+                        del connection.connection.notifies[:]
+                        self.notify_waiters()
+            except Exception as err:
+                print('Task notification listener failed, reconnecting:', err)
+                sleep(5)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+_task_notifier = None
+
+
+def get_task_notifier():
+    global _task_notifier
+    if _task_notifier is None:
+        if database.engine.dialect.name == 'postgresql':
+            _task_notifier = PostgresTaskNotifier(database.engine)
+            # listen right away rather than when the first request waits, so that no signal is missed
+            _task_notifier.start_listener()
+        else:
+            _task_notifier = TaskNotifier()
+    return _task_notifier
@@ -0,0 +1,126 @@
+from collections import defaultdict
+
+from sqlalchemy.dialects.postgresql import insert
+
+from x5learn_server.db.database import db_session
+from x5learn_server.interval_set import IntervalSet
+from x5learn_server.models import Action, VideoUsage
+
+# Number of seconds between actions that report the ongoing video play position.
+# Keep this constant in sync with videoPlayReportingInterval on the frontend!
+VIDEO_PLAY_REPORTING_INTERVAL = 10
+
+# Play, pause, seek and still-playing actions, which report the position in the video
+VIDEO_POSITION_ACTION_TYPE_IDS = [4, 5, 6, 9]
+
+# Number of actions that the rebuild loads from the database at a time
+REBUILD_BATCH_SIZE = 10000
+
+
+def watched_ranges(serialized_ranges=()):
+    """returns the watched ranges as an IntervalSet, in which each reported play position
+    counts as watching the following VIDEO_PLAY_REPORTING_INTERVAL seconds,
+    and ranges that are less than VIDEO_PLAY_REPORTING_INTERVAL seconds apart are joined.
+    This gives the same ranges regardless of the order in which the positions are added.
+    """
+    return IntervalSet.deserialize(serialized_ranges, min_gap=VIDEO_PLAY_REPORTING_INTERVAL)
+
+
+def add_position(ranges, position):
+    ranges.add(position, position + VIDEO_PLAY_REPORTING_INTERVAL)
+
+
+def ranges_from_positions(positions):
+    return IntervalSet.from_positions(positions, VIDEO_PLAY_REPORTING_INTERVAL, min_gap=VIDEO_PLAY_REPORTING_INTERVAL)
+
+
+def serialize_ranges(ranges):
+    # the format that the frontend expects
+    return [{'start': start, 'length': end - start} for start, end in ranges]
+
+
+def position_from_action(action_type_id, params):
+    """returns (oer_id, position) for actions that report a video play position, otherwise None."""
+    if action_type_id not in VIDEO_POSITION_ACTION_TYPE_IDS or not isinstance(params, dict):
+        return None
+    try:
+        return int(params['oerId']), float(params['positionInSeconds'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def update_video_usages(rows):
+    """merges the positions from newly logged actions into the watched ranges, within the caller's transaction."""
+    positions_per_video = defaultdict(list)
+    for row in rows:
+        position = position_from_action(row['action_type_id'], row['params'])
+        if position is not None and row['user_login_id'] is not None:
+            oer_id, position_in_seconds = position
+            positions_per_video[(row['user_login_id'], oer_id)].append(position_in_seconds)
+    # locking the rows in a fixed order avoids deadlocks between concurrent requests
+    for (user_login_id, oer_id), positions in sorted(positions_per_video.items()):
+        db_session.execute(insert(VideoUsage.__table__).values(user_login_id=user_login_id, oer_id=oer_id, ranges=[])
+                           .on_conflict_do_nothing())
+        ranges = watched_ranges(db_session.query(VideoUsage.ranges)
+                                .filter(VideoUsage.user_login_id == user_login_id, VideoUsage.oer_id == oer_id)
+                                .with_for_update().scalar())
+        for position in positions:
+            add_position(ranges, position)
+        db_session.execute(VideoUsage.__table__.update()
+                           .where(VideoUsage.user_login_id == user_login_id)
+                           .where(VideoUsage.oer_id == oer_id)
+                           .values(ranges=ranges.serialize()))
+
+
+def get_video_usages(user_login_id, oer_ids=None):
+    """returns the watched ranges per OER id as IntervalSets, optionally only for the given OERs."""
+    query = db_session.query(VideoUsage.oer_id, VideoUsage.ranges).filter(VideoUsage.user_login_id == user_login_id)
+    if oer_ids is not None:
+        query = query.filter(VideoUsage.oer_id.in_(oer_ids))
+    return {oer_id: watched_ranges(ranges) for oer_id, ranges in query}
+
+
+def rebuild_video_usages(user_login_ids=None):
+    """recomputes the watched ranges from the complete action history, e.g. to backfill them.
+    The caller commits. Positions that are logged while the rebuild is running may be overwritten,
+    so rebuild the affected users again if it ran during busy times.
+
+    Args:
+        user_login_ids (list(int)): only rebuild the ranges of these users, or of all users if None
+
+    Returns:
+        (int): number of rebuilt ranges
+
+    """
+    query = db_session.query(Action.user_login_id, Action.action_type_id, Action.params) \
+        .filter(Action.action_type_id.in_(VIDEO_POSITION_ACTION_TYPE_IDS), Action.user_login_id.isnot(None)) \
+        .order_by(Action.user_login_id, Action.id).execution_options(stream_results=True)
+    if user_login_ids is not None:
+        query = query.filter(Action.user_login_id.in_(user_login_ids))
+    rebuilt = 0
+    current_user_login_id = None
+    positions_per_oer = defaultdict(list)
+    # the actions arrive ordered by user, so each user's ranges can be written as soon as the next user starts
+    for user_login_id, action_type_id, params in query.yield_per(REBUILD_BATCH_SIZE):
+        if user_login_id != current_user_login_id:
+            rebuilt += replace_video_usages(current_user_login_id, positions_per_oer)
+            current_user_login_id = user_login_id
+            positions_per_oer = defaultdict(list)
+        position = position_from_action(action_type_id, params)
+        if position is not None:
+            oer_id, position_in_seconds = position
+            positions_per_oer[oer_id].append(position_in_seconds)
+    rebuilt += replace_video_usages(current_user_login_id, positions_per_oer)
+    return rebuilt
+
+
+def replace_video_usages(user_login_id, positions_per_oer):
+    if not positions_per_oer:
+        return 0
+    values = [{'user_login_id': user_login_id, 'oer_id': oer_id,
+               'ranges': ranges_from_positions(positions).serialize()}
+              for oer_id, positions in positions_per_oer.items()]
+    statement = insert(VideoUsage.__table__).values(values)
+    db_session.execute(statement.on_conflict_do_update(index_elements=['user_login_id', 'oer_id'],
+                                                       set_={'ranges': statement.excluded.ranges}))
+    return len(values)
@@ -0,0 +1,120 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# This module talks to the X5GON platform API.
+# It deliberately doesn't touch the database, so that it can be used
+# (and benchmarked) without the flask app - see helper_scripts/benchmark_search_latency.py
+
+X5GON_PLATFORM_URL = 'https://platform.x5gon.org/api/v1'
+
+SEARCH_ENDPOINT = '/search/?url=https://platform.x5gon.org/materialUrl&type=all&text={}&page={}'
+CAPTIONS_ENDPOINT = '/oer_materials/{}/contents?extension=webvtt'
+
+# Max number of seconds to wait for a single request to the X5GON API
+X5GON_API_TIMEOUT = 10
+
+# Max number of requests to the X5GON API that a single search runs in parallel
+X5GON_API_MAX_WORKERS = 8
+
+# Number of result pages that are requested at once after the first page
+SEARCH_PAGES_PER_ROUND = 3
+
+# Reuse connections across searches (requests.Session is fine to share between threads for simple GETs)
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=X5GON_API_MAX_WORKERS))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=X5GON_API_MAX_WORKERS))
+
+
+def search_materials(text, max_results, max_workers=X5GON_API_MAX_WORKERS):
+    """Fetches search results from the X5GON API, including captions.
+
+    The first page is requested on its own to find out the total number of pages.
+    Subsequent pages are requested a few at a time, in parallel. The captions of all
+    materials on a page are fetched in parallel too. Pages are consumed in order,
+    so the results come out in the same order as if the pages had been walked one by one.
+
+    Args:
+        text (str): url-quoted search text
+        max_results (int): stop once this many materials have been collected
+        max_workers (int): max number of parallel requests. 1 makes the search fully sequential.
+
+    Returns:
+        (list(dict)): materials with 'translations', in search result order
+
+    """
+    materials = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        page = fetch_search_page(text, 1)
+        total_pages = page['metadata']['total_pages']
+        next_page_number = 2
+        pending_pages = []
+        while True:
+            page_materials = usable_materials(page['rec_materials'])[:max_results - len(materials)]
+            # request the next few pages while the captions for this page are being fetched
+            if not pending_pages and next_page_number <= total_pages and len(materials) + len(
+                    page_materials) < max_results:
+                last_page_number = min(next_page_number + SEARCH_PAGES_PER_ROUND - 1, total_pages)
+                pending_pages = [executor.submit(fetch_search_page, text, n) for n in
+                                 range(next_page_number, last_page_number + 1)]
+                next_page_number = last_page_number + 1
+            materials += list(executor.map(fetch_captions_from_x5gon_api, page_materials))
+            if len(materials) >= max_results or not pending_pages:
+                break
+            page = pending_pages.pop(0).result()
+        for future in pending_pages:
+            future.cancel()
+    return materials
+
+
+def fetch_search_page(text, page_number):
+    response = session.get(X5GON_PLATFORM_URL + SEARCH_ENDPOINT.format(text, page_number), timeout=X5GON_API_TIMEOUT)
+    return response.json()
+
+
+def usable_materials(materials):
+    materials = filter_x5gon_search_results(materials)
+    # Some urls that were longer than 255 caused errors.
+    # TODO: change the type of all url colums from String(255) to Text()
+    # Temporary fix: ignore search results with very long urls
+    return [m for m in materials if len(m['url']) <= 255]
+
+
+def filter_x5gon_search_results(materials):
+    # (un)comment the lines below to enable/disable filters as desired
+
+    # include videos only
+    materials = [m for m in materials if is_video(m['url'])]
+
+    # exclude youtube videos
+    materials = [m for m in materials if 'youtu' not in m['url']]
+
+    # filter by file suffix
+    # materials = [m for m in materials if m['url'].endswith(
+    #     '.pdf') or is_video(m['url'])]
+
+    # crudely filter out materials from MIT OCW that are assignments or date back to the 90s or early 2000s
+    # materials = [m for m in materials if '/assignments/' not in m['url']
+    #              and '199' not in m['url'] and '200' not in m['url']]
+
+    # Exclude non-english materials because they tend to come out poorly after wikification. X5GON search doesn't have a language parameter at the time of writing.
+    # materials = [m for m in materials if m['language'] == 'en']
+    return materials
+
+
+def fetch_captions_from_x5gon_api(material):
+    contents = session.get(X5GON_PLATFORM_URL + CAPTIONS_ENDPOINT.format(material['material_id']),
+                           timeout=X5GON_API_TIMEOUT).json()
+
+    material['translations'] = {}
+    for content in contents['oer_contents']:
+        # api does not seem to filter webvtt yet so doing it manually
+        if content['extension'] != 'webvtt':
+            continue
+        material['translations'][content['language']] = content.get('value', '').get('value', '')
+
+    return material
+
+
+def is_video(url):
+    url = url.lower()
+    return url.endswith('.mp4') or url.endswith('.webm') or url.endswith('.ogg')